@@ -1,14 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import sqlite3
 import requests
-import json
 from datetime import datetime, timedelta
 import os
 from contextlib import contextmanager
 import logging
+import math
 import time
+import threading
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 from functools import wraps  
+from urllib.parse import quote_plus
+
+try:
+    import orjson
+except ImportError:  # Optional, Flask's default JSON provider is used without it
+    orjson = None
 
 app = Flask(__name__)
 CORS(app)
@@ -16,28 +27,195 @@ CORS(app)
 # Configuration
 DATABASE_PATH = 'crypto_tracker.db'
 COINGECKO_API_BASE = 'https://api.coingecko.com/api/v3'
+CIRCUIT_FAILURE_THRESHOLD = 5   # Consecutive upstream failures before the circuit opens
+CIRCUIT_RESET_TIMEOUT = 30      # Seconds to wait before probing the upstream again
+ALERT_WEBHOOK_URL = os.environ.get('ALERT_WEBHOOK_URL')  # Optional sink for triggered alerts
+ALERT_REFRESH_INTERVAL = 60     # Seconds between price refreshes of coins with active alerts
+SNAPSHOT_INTERVAL = 3600        # Seconds between portfolio value snapshots
+SNAPSHOT_LOCK_TTL = 300         # Seconds one worker may spend taking a snapshot
+PRICE_CACHE_TTL = 60            # Seconds a quote in price_cache is shared before refetching
+COIN_CACHE_TTL = 300            # Seconds a cached market page is served before refetching
+TOP_GROWTH_TTL = 3600           # Seconds the 1-year growth ranking is served before recomputing
+CATALOG_TTL = 86400             # Seconds the full coin list used for search is kept
+WARMUP_MARKET_PAGES = [(1, 50), (2, 50), (1, 100)]  # (page, per_page) preloaded at startup
+WARMUP_TIMEOUT = 60             # Seconds /api/health reports warming_up at most
+SIMPLE_PRICE_MAX_URL_LENGTH = 2000  # Longest /simple/price URL sent upstream
+PRICE_CHUNK_WORKERS = 4         # Concurrent /simple/price requests per fetch
+MAX_BATCH_IDS = 5000            # Most coin ids accepted by /api/prices/batch
+SEARCH_CACHE_TTL = 600          # Seconds search results are served before refetching
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'sqlite')  # sqlite, memory or redis
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+CACHE_LOCK_TTL = 30             # Seconds a refresh lock is held before it expires
+CACHE_LOCK_WAIT = 15            # Seconds a worker waits for another worker's refresh
+PRICE_KEY_PREFIX = 'price:'     # Cache keys of per-coin quotes
+CACHE_ENTRY_TTL = 7 * 86400     # Seconds a cache entry is kept as last-known-good data
+SEARCH_ENTRY_TTL = 86400        # Seconds a search result is kept, one entry per distinct query
+MEMORY_CACHE_MAX_ENTRIES = 10000  # Entries the memory backend holds before evicting the least recently used
+ALERTS_VERSION_KEY = 'alerts_version'  # Cache key changed whenever alert rules are added or removed
+PRICE_HISTORY_KEY_PREFIX = 'price_history:'  # Cache keys of recent prices for percent_move alerts
+UNKNOWN_COIN_KEY_PREFIX = 'unknown_coin:'  # Cache keys of ids /simple/price returned nothing for
+UNKNOWN_COIN_TTL = 600          # Seconds an id without a price isn't asked for again
+TOP_GROWTH_LOCK_TTL = 120       # Seconds the 11-call top-growth computation may hold its lock
+DEFAULT_USER_ID = 'default'     # Owner of every request in single-user mode, and of pre-multi-user data
+TRUST_USER_HEADER = os.environ.get('TRUST_USER_HEADER') == '1'  # Only behind a proxy that sets X-User-Id
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Fast JSON serialization
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson for jsonify, request bodies and cached payloads"""
+
+    option = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj).decode()
+
+    def dumps_bytes(self, obj):
+        return orjson.dumps(obj, default=self.default, option=self.option)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+if orjson:
+    app.json = OrjsonProvider(app)
+
+def dumps_bytes(obj):
+    """Serialize obj to bytes with the active JSON provider"""
+    if isinstance(app.json, OrjsonProvider):
+        return app.json.dumps_bytes(obj)
+    return app.json.dumps(obj).encode()
+
+def json_bytes_response(body, status=200):
+    """Response for a body that is already serialized JSON"""
+    return app.response_class(body, status=status, mimetype='application/json')
+
 # Rate limiter decorator
 def rate_limited(max_per_second=1):
     min_interval = 1.0 / max_per_second
     last_called = [0.0]
+    lock = threading.Lock()
 
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            elapsed = time.time() - last_called[0]
-            wait_time = min_interval - elapsed
-            if wait_time > 0:
-                time.sleep(wait_time)
-            last_called[0] = time.time()
+            # Reserve the next free slot under the lock so concurrent callers are spaced out too
+            with lock:
+                now = time.time()
+                slot = max(now, last_called[0] + min_interval)
+                last_called[0] = slot
+            if slot > now:
+                time.sleep(slot - now)
             return func(*args, **kwargs)
         return wrapper
     return decorator
 
+# Circuit breaker around the CoinGecko client
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling CoinGecko while the circuit is open"""
+
+class CircuitBreaker:
+    """Stop calling the upstream after repeated failures and probe it again later.
+
+    closed    -> requests flow normally, consecutive failures are counted
+    open      -> requests fail fast until reset_timeout has passed
+    half_open -> a single probe request is let through; success closes the
+                 circuit, failure opens it again
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_until = 0.0
+        self.last_failure = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        """True while callers should skip the upstream and serve cached data"""
+        with self._lock:
+            if self.state == 'open':
+                return time.time() < self.opened_until
+            return self.state == 'half_open'
+
+    def allow_request(self):
+        """Return True if a request may be sent upstream right now"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.time() >= self.opened_until:
+                # Let exactly one probe through
+                self.state = 'half_open'
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("CoinGecko probe succeeded, closing circuit")
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self, reason, retry_after=None):
+        with self._lock:
+            self.failures += 1
+            self.last_failure = reason
+            # A 429 is the upstream telling us to back off, so open straight away
+            if self.state == 'half_open' or retry_after is not None or self.failures >= self.failure_threshold:
+                cooldown = max(self.reset_timeout, retry_after or 0)
+                self.state = 'open'
+                self.opened_until = time.time() + cooldown
+                logger.warning(f"Opening CoinGecko circuit for {cooldown}s: {reason}")
+
+    def status(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'last_failure': self.last_failure,
+                'retry_in': max(0, round(self.opened_until - time.time())) if self.state == 'open' else 0
+            }
+
+upstream_breaker = CircuitBreaker()
+
+def coingecko_get(path, params=None, timeout=10):
+    """GET a CoinGecko endpoint through the circuit breaker"""
+    if not upstream_breaker.allow_request():
+        raise CircuitOpenError(f"CoinGecko circuit open, skipping {path}")
+
+    try:
+        response = requests.get(f"{COINGECKO_API_BASE}{path}", params=params, timeout=timeout)
+    except requests.RequestException as e:
+        upstream_breaker.record_failure(str(e))
+        raise
+
+    if response.status_code == 429:
+        try:
+            retry_after = int(response.headers.get('Retry-After', CIRCUIT_RESET_TIMEOUT))
+        except ValueError:
+            retry_after = CIRCUIT_RESET_TIMEOUT
+        upstream_breaker.record_failure('429 Too Many Requests', retry_after=retry_after)
+    elif response.status_code >= 500:
+        upstream_breaker.record_failure(f"{response.status_code} from {path}")
+    else:
+        upstream_breaker.record_success()
+
+    response.raise_for_status()
+    return response
+
+def degraded_fields(age_seconds):
+    """Response fields flagging last-known-good data served during an outage"""
+    if age_seconds is None:
+        return {}
+    return {'stale': True, 'data_age_seconds': round(age_seconds)}
+
 # Database context manager
 @contextmanager
 def get_db_connection():
@@ -49,12 +227,20 @@ def get_db_connection():
         conn.close()
 
 # Initialize database
+def add_column_if_missing(conn, table, column, definition):
+    """Bring tables created by older versions up to the current schema"""
+    columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if columns and column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
 def init_db():
     with get_db_connection() as conn:
         # Portfolio table
         conn.execute('''
             CREATE TABLE IF NOT EXISTS portfolio (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL DEFAULT 'default',
+                portfolio_name TEXT NOT NULL DEFAULT 'main',
                 coin_id TEXT NOT NULL,
                 coin_name TEXT NOT NULL,
                 symbol TEXT NOT NULL,
@@ -65,20 +251,42 @@ def init_db():
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        add_column_if_missing(conn, 'portfolio', 'user_id', "TEXT NOT NULL DEFAULT 'default'")
+        add_column_if_missing(conn, 'portfolio', 'portfolio_name', "TEXT NOT NULL DEFAULT 'main'")
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_portfolio_user
+            ON portfolio (user_id, portfolio_name, created_at)
+        ''')
         
+        # Single-user watchlists were unique on coin_id alone, rebuild them per user
+        columns = [row['name'] for row in conn.execute('PRAGMA table_info(watchlist)')]
+        if columns and 'user_id' not in columns:
+            # One transaction, so a failed rebuild leaves the old table in place
+            conn.execute('BEGIN')
+            conn.execute('ALTER TABLE watchlist RENAME TO watchlist_single_user')
+
         # Watchlist table
         conn.execute('''
             CREATE TABLE IF NOT EXISTS watchlist (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL DEFAULT 'default',
                 coin_id TEXT NOT NULL,
                 coin_name TEXT NOT NULL,
                 symbol TEXT NOT NULL,
                 added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(coin_id)  -- Prevent duplicate coins
+                UNIQUE(user_id, coin_id)  -- Prevent duplicate coins
             )
         ''')
+
+        if columns and 'user_id' not in columns:
+            conn.execute('''
+                INSERT INTO watchlist (id, coin_id, coin_name, symbol, added_at)
+                SELECT id, coin_id, coin_name, symbol, added_at FROM watchlist_single_user
+            ''')
+            conn.execute('DROP TABLE watchlist_single_user')
+            conn.commit()
         
-        # Price cache table for better performance
+        # Price cache table for better performance, shared by all users
         conn.execute('''
             CREATE TABLE IF NOT EXISTS price_cache (
                 coin_id TEXT PRIMARY KEY,
@@ -91,111 +299,1003 @@ def init_db():
             CREATE TABLE IF NOT EXISTS coin_cache (
                 endpoint TEXT PRIMARY KEY,
                 data TEXT NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expires_at REAL
+            )
+        ''')
+        add_column_if_missing(conn, 'coin_cache', 'expires_at', 'REAL')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_coin_cache_expires ON coin_cache (expires_at)')
+
+        # Cross-worker refresh locks for the SQLite cache backend
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_locks (
+                name TEXT PRIMARY KEY,
+                token TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+
+        # Price alert rules attached to watchlist entries
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL DEFAULT 'default',
+                watchlist_id INTEGER NOT NULL,
+                coin_id TEXT NOT NULL,
+                alert_type TEXT NOT NULL,  -- above, below or percent_move
+                threshold REAL NOT NULL,
+                window_minutes INTEGER,    -- Only used by percent_move
+                active INTEGER NOT NULL DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        add_column_if_missing(conn, 'alerts', 'user_id', "TEXT NOT NULL DEFAULT 'default'")
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_alerts_active_coin ON alerts (active, coin_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_alerts_user ON alerts (user_id, created_at)')
+
+        # Triggered alerts waiting to be picked up
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS alert_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL DEFAULT 'default',
+                alert_id INTEGER NOT NULL,
+                coin_id TEXT NOT NULL,
+                alert_type TEXT NOT NULL,
+                threshold REAL NOT NULL,
+                price REAL NOT NULL,
+                change_percentage REAL,
+                triggered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        add_column_if_missing(conn, 'alert_events', 'user_id', "TEXT NOT NULL DEFAULT 'default'")
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_alert_events_user ON alert_events (user_id, id)')
+
+        # Periodic portfolio totals for history charts and performance analytics
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL DEFAULT 'default',
+                taken_at TIMESTAMP NOT NULL,
+                total_value REAL NOT NULL,
+                total_cost REAL NOT NULL,
+                total_holdings INTEGER NOT NULL,
+                net_flow REAL,   -- Market value of lots added minus removed since the previous snapshot
+                holdings TEXT    -- JSON {coin_id: quantity} the next net_flow is measured against
             )
         ''')
+        add_column_if_missing(conn, 'portfolio_snapshots', 'user_id', "TEXT NOT NULL DEFAULT 'default'")
+        add_column_if_missing(conn, 'portfolio_snapshots', 'net_flow', 'REAL')
+        add_column_if_missing(conn, 'portfolio_snapshots', 'holdings', 'TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_snapshots_taken_at ON portfolio_snapshots (taken_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_snapshots_user ON portfolio_snapshots (user_id, taken_at)')
         
         conn.commit()
 
-# Helper functions
-def fetch_coin_data(coin_ids, vs_currency='usd'):
-    """Fetch current price data from CoinGecko API"""
-    try:
-        if isinstance(coin_ids, list):
-            coin_ids = ','.join(coin_ids)
-        
-        url = f"{COINGECKO_API_BASE}/simple/price"
-        params = {
-            'ids': coin_ids,
-            'vs_currencies': vs_currency,
-            'include_24hr_change': 'true',
-            'include_market_cap': 'true'
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        logger.error(f"Error fetching coin data: {e}")
-        return {}
+# Cache backends
+class CacheBackend:
+    """Storage behind the market, price and search caches.
 
-@rate_limited(0.5)  # Maximum 1 request every 2 seconds
-def fetch_coins_list(page=1, per_page=50, order='market_cap_desc'):
-    """Fetch list of coins from CoinGecko with caching"""
-    try:
-        cache_key = f"coins_list_{page}_{per_page}_{order}"
-        
-        # Check cache first
+    Entries are JSON-serializable payloads read back together with their age
+    in seconds. lock() is held across every worker sharing the backend, so a
+    key is only refreshed upstream by one of them at a time.
+    """
+
+    name = None
+
+    def get_entries(self, keys):
+        """Return {key: (data, age_seconds, version)} for the keys that are cached"""
+        raise NotImplementedError
+
+    def set_many(self, items, ttl=CACHE_ENTRY_TTL):
+        """Store every {key: data} pair in items for ttl seconds, returning the version they were stored under"""
+        raise NotImplementedError
+
+    def stat(self, key):
+        """Return (version, age_seconds) for a key without decoding it, or (None, None)"""
+        raise NotImplementedError
+
+    def acquire_lock(self, name, token, ttl):
+        raise NotImplementedError
+
+    def release_lock(self, name, token):
+        raise NotImplementedError
+
+    def acquire_locks(self, names, token, ttl):
+        """Try each lock once, returning the set of names acquired"""
+        return {name for name in names if self.acquire_lock(name, token, ttl)}
+
+    def release_locks(self, names, token):
+        for name in names:
+            self.release_lock(name, token)
+
+    def get_many(self, keys):
+        """Return {key: (data, age_seconds)} for the keys that are cached"""
+        return {key: (data, age) for key, (data, age, _) in self.get_entries(keys).items()}
+
+    def get(self, key):
+        return self.get_many([key]).get(key, (None, None))
+
+    def get_entry(self, key):
+        return self.get_entries([key]).get(key, (None, None, None))
+
+    def set(self, key, data, ttl=CACHE_ENTRY_TTL):
+        return self.set_many({key: data}, ttl)
+
+    @contextmanager
+    def lock(self, name, ttl=CACHE_LOCK_TTL, wait=CACHE_LOCK_WAIT):
+        """Hold name for at most ttl seconds; yields False if it wasn't free within wait seconds"""
+        token = uuid.uuid4().hex
+        deadline = time.time() + wait
+        acquired = self.acquire_lock(name, token, ttl)
+        while not acquired and time.time() < deadline:
+            time.sleep(0.05)
+            acquired = self.acquire_lock(name, token, ttl)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release_lock(name, token)
+
+    @contextmanager
+    def try_locks(self, names, ttl=CACHE_LOCK_TTL):
+        """Hold whichever of names are free right now; yields the set acquired"""
+        token = uuid.uuid4().hex
+        acquired = self.acquire_locks(names, token, ttl)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release_locks(acquired, token)
+
+class SqliteCacheBackend(CacheBackend):
+    """Cache in the app database: prices in price_cache, everything else in coin_cache.
+
+    price_cache holds at most one row per coin and is kept; coin_cache rows
+    expire and are pruned whenever coin_cache is written.
+    """
+
+    name = 'sqlite'
+
+    def _tables(self, keys):
+        """Group keys by the table that stores them, as {(table, key column, time column): {row key: key}}"""
+        tables = {}
+        for key in keys:
+            if key.startswith(PRICE_KEY_PREFIX):
+                table = ('price_cache', 'coin_id', 'updated_at')
+                tables.setdefault(table, {})[key[len(PRICE_KEY_PREFIX):]] = key
+            else:
+                tables.setdefault(('coin_cache', 'endpoint', 'timestamp'), {})[key] = key
+        return tables
+
+    def _select(self, conn, columns, table, key_column, row_keys):
+        """Rows of table for row_keys that haven't expired"""
+        placeholders = ','.join('?' * len(row_keys))
+        query = f'SELECT {columns} FROM {table} WHERE {key_column} IN ({placeholders})'
+        params = list(row_keys)
+        if table == 'coin_cache':
+            query += ' AND (expires_at IS NULL OR expires_at > ?)'
+            params.append(time.time())
+        return conn.execute(query, params).fetchall()
+
+    def get_entries(self, keys):
+        now = datetime.now()
+        cached = {}
         with get_db_connection() as conn:
-            cursor = conn.execute(
-                'SELECT data, timestamp FROM coin_cache WHERE endpoint = ?', 
-                (cache_key,)
-            )
-            cache_data = cursor.fetchone()
-            
-            # Return cached data if it's less than 5 minutes old
-            if cache_data:
-                data = json.loads(cache_data['data'])
-                cache_time = datetime.fromisoformat(cache_data['timestamp'])
-                if datetime.now() - cache_time < timedelta(minutes=5):
-                    logger.info("Returning cached coin data")
-                    return data
-
-        # If no cache or expired, fetch from API
-        url = f"{COINGECKO_API_BASE}/coins/markets"
-        params = {
-            'vs_currency': 'usd',
-            'order': order,
-            'per_page': per_page,
-            'page': page,
-            'sparkline': 'false'
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+            for (table, key_column, time_column), row_keys in self._tables(keys).items():
+                columns = f'{key_column} AS row_key, data, {time_column} AS stored_at'
+                for row in self._select(conn, columns, table, key_column, row_keys):
+                    age = (now - datetime.fromisoformat(row['stored_at'])).total_seconds()
+                    cached[row_keys[row['row_key']]] = (app.json.loads(row['data']), age, row['stored_at'])
+        return cached
 
-        # Update cache
+    def set_many(self, items, ttl=CACHE_ENTRY_TTL):
+        now = datetime.now().isoformat()
         with get_db_connection() as conn:
-            conn.execute(
-                'INSERT OR REPLACE INTO coin_cache (endpoint, data, timestamp) VALUES (?, ?, ?)',
-                (cache_key, json.dumps(data), datetime.now().isoformat())
+            for (table, key_column, time_column), row_keys in self._tables(items).items():
+                rows = [(row_key, app.json.dumps(items[key]), now) for row_key, key in row_keys.items()]
+                if table == 'coin_cache':
+                    expires_at = time.time() + ttl
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO coin_cache (endpoint, data, timestamp, expires_at) VALUES (?, ?, ?, ?)',
+                        [row + (expires_at,) for row in rows]
+                    )
+                    conn.execute('DELETE FROM coin_cache WHERE expires_at < ?', (time.time(),))
+                else:
+                    conn.executemany(
+                        f'INSERT OR REPLACE INTO {table} ({key_column}, data, {time_column}) VALUES (?, ?, ?)',
+                        rows
+                    )
+            conn.commit()
+        return now
+
+    def stat(self, key):
+        for (table, key_column, time_column), row_keys in self._tables([key]).items():
+            with get_db_connection() as conn:
+                rows = self._select(conn, f'{time_column} AS stored_at', table, key_column, row_keys)
+            if rows:
+                stored_at = rows[0]['stored_at']
+                return stored_at, (datetime.now() - datetime.fromisoformat(stored_at)).total_seconds()
+        return None, None
+
+    def acquire_lock(self, name, token, ttl):
+        return name in self.acquire_locks([name], token, ttl)
+
+    def release_lock(self, name, token):
+        self.release_locks([name], token)
+
+    def acquire_locks(self, names, token, ttl):
+        now = time.time()
+        acquired = set()
+        with get_db_connection() as conn:
+            for name in names:
+                conn.execute('DELETE FROM cache_locks WHERE name = ? AND expires_at < ?', (name, now))
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO cache_locks (name, token, expires_at) VALUES (?, ?, ?)',
+                    (name, token, now + ttl)
+                )
+                if cursor.rowcount == 1:
+                    acquired.add(name)
+            conn.commit()
+        return acquired
+
+    def release_locks(self, names, token):
+        with get_db_connection() as conn:
+            conn.executemany(
+                'DELETE FROM cache_locks WHERE name = ? AND token = ?',
+                [(name, token) for name in names]
             )
             conn.commit()
 
-        return data
+class MemoryCacheBackend(CacheBackend):
+    """Per-process cache, for a single worker or tests; locks don't span processes.
+
+    Holds at most max_entries, evicting the least recently used ones.
+    """
+
+    name = 'memory'
+
+    def __init__(self, max_entries=MEMORY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # {key: (serialized data, stored_at, expires_at)}, oldest use first
+        self._locks = {}               # {name: (token, expires_at)}
+        self._mutex = threading.Lock()
+
+    def _live_entry(self, key, now):
+        """The entry for key if it hasn't expired, marked as recently used; call under the mutex"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_entries(self, keys):
+        now = time.time()
+        with self._mutex:
+            entries = [(key, self._live_entry(key, now)) for key in keys]
+        # Entries are stored serialized so callers can't mutate the cached copy
+        return {key: (app.json.loads(entry[0]), now - entry[1], entry[1]) for key, entry in entries if entry}
+
+    def set_many(self, items, ttl=CACHE_ENTRY_TTL):
+        now = time.time()
+        serialized = {key: (app.json.dumps(data), now, now + ttl) for key, data in items.items()}
+        with self._mutex:
+            for key, entry in serialized.items():
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return now
+
+    def stat(self, key):
+        now = time.time()
+        with self._mutex:
+            entry = self._live_entry(key, now)
+        return (entry[1], now - entry[1]) if entry else (None, None)
+
+    def acquire_lock(self, name, token, ttl):
+        now = time.time()
+        with self._mutex:
+            holder = self._locks.get(name)
+            if holder and holder[1] > now:
+                return False
+            self._locks[name] = (token, now + ttl)
+            return True
+
+    def release_lock(self, name, token):
+        with self._mutex:
+            if self._locks.get(name, (None,))[0] == token:
+                del self._locks[name]
+
+class RedisCacheBackend(CacheBackend):
+    """Cache in a Redis-protocol server shared by every worker and host"""
+
+    name = 'redis'
+
+    def __init__(self, url, prefix='crypto_tracker:'):
+        # Only deployments that pick this backend need the redis package
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._watch_error = redis.WatchError
+
+    def get_entries(self, keys):
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hmget(self.prefix + key, 'data', 'stored_at')
+        now = time.time()
+        return {
+            key: (app.json.loads(data), now - float(stored_at), stored_at.decode())
+            for key, (data, stored_at) in zip(keys, pipe.execute())
+            if data is not None
+        }
+
+    def set_many(self, items, ttl=CACHE_ENTRY_TTL):
+        stored_at = repr(time.time())
+        pipe = self.client.pipeline(transaction=False)
+        for key, data in items.items():
+            pipe.hset(self.prefix + key, mapping={'data': app.json.dumps(data), 'stored_at': stored_at})
+            pipe.pexpire(self.prefix + key, int(ttl * 1000))
+        pipe.execute()
+        return stored_at
+
+    def stat(self, key):
+        stored_at = self.client.hget(self.prefix + key, 'stored_at')
+        if stored_at is None:
+            return None, None
+        return stored_at.decode(), time.time() - float(stored_at)
+
+    def acquire_lock(self, name, token, ttl):
+        return name in self.acquire_locks([name], token, ttl)
+
+    def release_lock(self, name, token):
+        self.release_locks([name], token)
+
+    def acquire_locks(self, names, token, ttl):
+        names = list(names)
+        pipe = self.client.pipeline(transaction=False)
+        for name in names:
+            pipe.set(f"{self.prefix}lock:{name}", token, nx=True, px=int(ttl * 1000))
+        return {name for name, acquired in zip(names, pipe.execute()) if acquired}
+
+    def release_locks(self, names, token):
+        lock_keys = [f"{self.prefix}lock:{name}" for name in names]
+        try:
+            self._delete_own_locks(lock_keys, token)
+        except self._watch_error:
+            # One of them changed hands meanwhile, release the rest one at a time
+            for lock_key in lock_keys:
+                try:
+                    self._delete_own_locks([lock_key], token)
+                except self._watch_error:
+                    pass
+
+    def _delete_own_locks(self, lock_keys, token):
+        # Only delete locks that are still ours, they may have expired and been retaken
+        with self.client.pipeline() as pipe:
+            pipe.watch(*lock_keys)
+            ours = [key for key, holder in zip(lock_keys, pipe.mget(lock_keys)) if holder == token.encode()]
+            pipe.multi()
+            if ours:
+                pipe.delete(*ours)
+            pipe.execute()
+
+def create_cache_backend(name):
+    if name == 'sqlite':
+        return SqliteCacheBackend()
+    if name == 'memory':
+        return MemoryCacheBackend()
+    if name == 'redis':
+        return RedisCacheBackend(REDIS_URL)
+    raise ValueError(f"Unknown CACHE_BACKEND: {name}")
+
+cache_backend = create_cache_backend(CACHE_BACKEND)
+
+# Cache helpers
+def read_cache(key):
+    """Return (data, age_seconds) for a cache entry, or (None, None) if missing"""
+    return cache_backend.get(key)
+
+def write_cache(key, data, ttl=CACHE_ENTRY_TTL):
+    """Store a payload in the cache, returning the version it was stored under"""
+    return cache_backend.set(key, data, ttl)
+
+class ResponseCache:
+    """Serialized response bodies, valid while the cache entry they were built from is unchanged"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, body):
+        with self._lock:
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+response_cache = ResponseCache()
+
+def store_prices(price_data):
+    """Remember the latest quote per coin as last-known-good data"""
+    previous_prices = {
+        coin_id: data.get('usd') for coin_id, data in load_cached_prices(list(price_data)).items()
+    }
+    cache_backend.set_many({PRICE_KEY_PREFIX + coin_id: data for coin_id, data in price_data.items()})
+
+    # Every refresh of the shared price cache is an alert evaluation pass
+    try:
+        evaluate_alerts(price_data, previous_prices)
+    except Exception as e:
+        logger.error(f"Error evaluating alerts: {e}")
+
+def load_cached_prices(coin_ids):
+    """Return last-known-good quotes, each tagged with its age in seconds"""
+    if not coin_ids:
+        return {}
+
+    cached = {}
+    for key, (data, age) in cache_backend.get_many([PRICE_KEY_PREFIX + coin_id for coin_id in coin_ids]).items():
+        data['age_seconds'] = age
+        cached[key[len(PRICE_KEY_PREFIX):]] = data
+    return cached
+
+def price_data_age(price_data):
+    """Age of the oldest cached quote in price_data, or None if everything is live"""
+    ages = [data['age_seconds'] for data in price_data.values() if 'age_seconds' in data]
+    return max(ages) if ages else None
+
+# Price alerts
+class AlertIndex:
+    """In-memory index of active alert rules, sorted by threshold per coin.
+
+    above/below rules fire when the price crosses their threshold between the
+    previous and the new quote in the shared price cache; a price that is
+    already past the threshold when the rule is created doesn't trigger it.
+    Bisecting each sorted list at both prices yields exactly the rules that
+    crossed, so an evaluation pass costs O(log n) per coin plus the number of
+    triggered rules rather than the total number of rules.
+
+    Every worker keeps its own index and rebuilds it when the alerts version
+    in the shared cache changes. The price history percent_move rules are
+    measured against is kept in the shared cache too, so it has every
+    worker's refreshes.
+    """
+
+    def __init__(self):
+        self._rules = None     # {coin_id: {key: ([thresholds], [alert_ids])}}, loaded lazily
+        self._version = None   # Alerts version the rules were loaded at
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Make every worker rebuild its index from the alerts table on its next pass"""
+        write_cache(ALERTS_VERSION_KEY, uuid.uuid4().hex)
+        with self._lock:
+            self._rules = None
+
+    def _load(self):
+        rules = {}
+        with get_db_connection() as conn:
+            cursor = conn.execute('''
+                SELECT id, coin_id, alert_type, threshold, window_minutes
+                FROM alerts WHERE active = 1 ORDER BY threshold
+            ''')
+            for row in cursor.fetchall():
+                # percent_move rules are grouped by window so each group shares one move value
+                key = (row['alert_type'], row['window_minutes'] if row['alert_type'] == 'percent_move' else None)
+                thresholds, alert_ids = rules.setdefault(row['coin_id'], {}).setdefault(key, ([], []))
+                thresholds.append(row['threshold'])
+                alert_ids.append(row['id'])
+        return rules
+
+    def _window_move(self, history, price, now, window_minutes):
+        """Percent move from the oldest observed price inside the window"""
+        cutoff = now - window_minutes * 60
+        for timestamp, old_price in history:
+            if timestamp >= cutoff:
+                return (price - old_price) / old_price * 100 if old_price else None
+        return None
+
+    def _update_histories(self, prices, now):
+        """Append prices to the shared history of coins with percent_move rules, trimmed to their longest window"""
+        windows = {}
+        for coin_id in prices:
+            coin_windows = [window for alert_type, window in self._rules.get(coin_id, {}) if alert_type == 'percent_move']
+            if coin_windows:
+                windows[coin_id] = max(coin_windows)
+        if not windows:
+            return {}
+
+        keys = {PRICE_HISTORY_KEY_PREFIX + coin_id: coin_id for coin_id in windows}
+        histories = {coin_id: [] for coin_id in windows}
+        for key, (history, _) in cache_backend.get_many(list(keys)).items():
+            histories[keys[key]] = history
+        for coin_id, history in histories.items():
+            cutoff = now - windows[coin_id] * 60
+            histories[coin_id] = [point for point in history if point[0] >= cutoff] + [[now, prices[coin_id]]]
+
+        cache_backend.set_many(
+            {PRICE_HISTORY_KEY_PREFIX + coin_id: history for coin_id, history in histories.items()},
+            ttl=max(windows.values()) * 60
+        )
+        return histories
+
+    def evaluate(self, prices, previous_prices):
+        """Return (alert_id, price, change_percentage) for every rule crossed by prices"""
+        now = time.time()
+        triggered = []
+        with self._lock:
+            # Read the version before the rules, so a change made meanwhile shows up next pass
+            version, _ = read_cache(ALERTS_VERSION_KEY)
+            if self._rules is None or version != self._version:
+                self._rules = self._load()
+                self._version = version
+
+            histories = self._update_histories(prices, now)
+
+            for coin_id, price in prices.items():
+                coin_rules = self._rules.get(coin_id)
+                if not coin_rules:
+                    continue
+
+                previous = previous_prices.get(coin_id)
+                for (alert_type, window), (thresholds, alert_ids) in coin_rules.items():
+                    change = None
+                    if alert_type in ('above', 'below') and previous is None:
+                        # Nothing to compare with yet, the next refresh can tell
+                        continue
+                    if alert_type == 'above':
+                        crossed = slice(bisect_right(thresholds, previous), bisect_right(thresholds, price))
+                    elif alert_type == 'below':
+                        crossed = slice(bisect_left(thresholds, price), bisect_left(thresholds, previous))
+                    else:
+                        change = self._window_move(histories[coin_id], price, now, window)
+                        if change is None:
+                            continue
+                        crossed = slice(0, bisect_right(thresholds, abs(change)))
+
+                    for alert_id in alert_ids[crossed]:
+                        triggered.append((alert_id, price, change))
+                    # Alerts fire once, so drop them from the index
+                    del thresholds[crossed]
+                    del alert_ids[crossed]
+
+        return triggered
+
+alert_index = AlertIndex()
+
+def deliver_alert_webhook(events):
+    """POST triggered alerts to the configured webhook sink"""
+    try:
+        requests.post(ALERT_WEBHOOK_URL, json={'alerts': events}, timeout=5)
+    except requests.RequestException as e:
+        logger.error(f"Error delivering alert webhook: {e}")
+
+def evaluate_alerts(price_data, previous_prices=None):
+    """Record and deliver alerts crossed by freshly fetched prices"""
+    prices = {coin_id: data['usd'] for coin_id, data in price_data.items() if data.get('usd')}
+    triggered = alert_index.evaluate(prices, previous_prices or {})
+    if not triggered:
+        return []
+
+    with get_db_connection() as conn:
+        # Every worker keeps its own index, so claim each alert in the database
+        # and only record it if this worker was the one to deactivate it. Rules
+        # deleted by another worker since the index was loaded match no row.
+        claimed = []
+        for alert_id, price, change in triggered:
+            cursor = conn.execute('UPDATE alerts SET active = 0 WHERE id = ? AND active = 1', (alert_id,))
+            if cursor.rowcount == 1:
+                claimed.append((alert_id, price, change))
+
+        events = []
+        if claimed:
+            placeholders = ','.join('?' * len(claimed))
+            rules = {
+                row['id']: row for row in conn.execute(
+                    f'SELECT id, user_id, coin_id, alert_type, threshold FROM alerts WHERE id IN ({placeholders})',
+                    [alert_id for alert_id, _, _ in claimed]
+                ).fetchall()
+            }
+            for alert_id, price, change in claimed:
+                rule = rules[alert_id]
+                cursor = conn.execute('''
+                    INSERT INTO alert_events (user_id, alert_id, coin_id, alert_type, threshold, price, change_percentage)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (rule['user_id'], alert_id, rule['coin_id'], rule['alert_type'], rule['threshold'], price, change))
+                events.append({
+                    'id': cursor.lastrowid,
+                    'user_id': rule['user_id'],
+                    'alert_id': alert_id,
+                    'coin_id': rule['coin_id'],
+                    'alert_type': rule['alert_type'],
+                    'threshold': rule['threshold'],
+                    'price': price,
+                    'change_percentage': change
+                })
+        conn.commit()
+
+    if not events:
+        return []
+
+    logger.info(f"Triggered {len(events)} price alerts")
+    if ALERT_WEBHOOK_URL:
+        threading.Thread(target=deliver_alert_webhook, args=(events,), daemon=True).start()
+    return events
+
+def run_alert_refresher():
+    """Refresh prices of coins with active alerts, so alerts fire without anyone polling"""
+    while True:
+        try:
+            with get_db_connection() as conn:
+                cursor = conn.execute('SELECT DISTINCT coin_id FROM alerts WHERE active = 1')
+                coin_ids = [row['coin_id'] for row in cursor.fetchall()]
+            # Quotes still fresh in the shared cache aren't fetched again
+            if coin_ids:
+                fetch_coin_data(coin_ids)
+        except Exception as e:
+            logger.error(f"Error refreshing alert prices: {e}")
+        time.sleep(ALERT_REFRESH_INTERVAL)
+
+# Helper functions
+def simple_price_params(vs_currency='usd'):
+    return {
+        'vs_currencies': vs_currency,
+        'include_24hr_vol': 'true',
+        'include_24hr_change': 'true',
+        'include_market_cap': 'true'
+    }
+
+def chunk_coin_ids(coin_ids, vs_currency='usd'):
+    """Split coin_ids into the fewest /simple/price requests that fit SIMPLE_PRICE_MAX_URL_LENGTH"""
+    base_url = requests.Request(
+        'GET', f"{COINGECKO_API_BASE}/simple/price", params=simple_price_params(vs_currency)
+    ).prepare().url
+    budget = SIMPLE_PRICE_MAX_URL_LENGTH - len(base_url) - len('&ids=')
+
+    chunks = []
+    chunk = []
+    length = 0
+    for coin_id in coin_ids:
+        id_length = len(quote_plus(coin_id))
+        separator = 3 if chunk else 0  # ',' is sent as %2C
+        if chunk and length + separator + id_length > budget:
+            chunks.append(chunk)
+            chunk = []
+            length = 0
+            separator = 0
+        chunk.append(coin_id)
+        length += separator + id_length
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+@rate_limited(2)  # At most 2 /simple/price requests started per second
+def fetch_price_chunk(coin_ids, vs_currency):
+    params = {'ids': ','.join(coin_ids), **simple_price_params(vs_currency)}
+    response = coingecko_get('/simple/price', params=params, timeout=10)
+    return response.json()
+
+def fetch_prices_upstream(coin_ids, vs_currency='usd'):
+    """Fetch quotes in URL-sized chunks, concurrently under the rate limiter.
+
+    Returns (prices, failed_ids) so callers can fall back per coin.
+    """
+    # Only needed once a fetch spans several chunks, so kept out of the import path
+    from concurrent.futures import ThreadPoolExecutor
+
+    def fetch(chunk):
+        # Don't queue behind the rate limiter when the upstream is known to be down
+        if upstream_breaker.is_open:
+            raise CircuitOpenError("CoinGecko circuit open")
+        return fetch_price_chunk(chunk, vs_currency)
+
+    chunks = chunk_coin_ids(coin_ids, vs_currency)
+    prices = {}
+    failed_ids = []
+    with ThreadPoolExecutor(max_workers=min(len(chunks), PRICE_CHUNK_WORKERS) or 1) as executor:
+        futures = [(chunk, executor.submit(fetch, chunk)) for chunk in chunks]
+        for chunk, future in futures:
+            try:
+                prices.update(future.result())
+            except requests.RequestException as e:
+                logger.error(f"Error fetching coin data: {e}")
+                failed_ids.extend(chunk)
+    return prices, failed_ids
+
+def refresh_usd_quotes(coin_ids):
+    """Fetch coin_ids upstream and store them in the shared price cache"""
+    data, failed_ids = fetch_prices_upstream(coin_ids)
+    if data:
+        store_prices(data)
+
+    # Remember ids CoinGecko answered without a price, so they aren't asked for on every read
+    failed = set(failed_ids)
+    unknown_ids = [coin_id for coin_id in coin_ids if coin_id not in data and coin_id not in failed]
+    if unknown_ids:
+        cache_backend.set_many(
+            {UNKNOWN_COIN_KEY_PREFIX + coin_id: True for coin_id in unknown_ids}, ttl=UNKNOWN_COIN_TTL
+        )
+    return data
+
+def get_usd_quotes(coin_ids):
+    """USD quotes from the shared price cache, refreshing those older than PRICE_CACHE_TTL.
+
+    Returns (quotes, fetched_ids). Each quote carries its age_seconds; ids
+    without any quote, fresh or last-known-good, are left out, and ids
+    CoinGecko recently had no price for aren't asked for again until
+    UNKNOWN_COIN_TTL has passed. Every coin is
+    refreshed under its own lock: a coin another worker is already fetching
+    is served from its older quote straight away. With nothing cached to
+    serve meanwhile, it is waited for until that worker releases the lock (at
+    most CACHE_LOCK_WAIT); whatever it stored by then is the answer.
+    """
+    quotes = load_cached_prices(coin_ids)
+    expired = [
+        coin_id for coin_id in coin_ids
+        if coin_id not in quotes or quotes[coin_id]['age_seconds'] >= PRICE_CACHE_TTL
+    ]
+    if expired:
+        unknown = cache_backend.get_many([UNKNOWN_COIN_KEY_PREFIX + coin_id for coin_id in expired])
+        expired = [coin_id for coin_id in expired if UNKNOWN_COIN_KEY_PREFIX + coin_id not in unknown]
+    # Don't wait on other workers when the upstream is known to be down
+    if not expired or upstream_breaker.is_open:
+        return quotes, []
+
+    fetched = {}
+    lock_names = {f"refresh:{PRICE_KEY_PREFIX}{coin_id}": coin_id for coin_id in expired}
+    with cache_backend.try_locks(lock_names) as locked:
+        mine = [coin_id for name, coin_id in lock_names.items() if name in locked]
+        waiting = [coin_id for name, coin_id in lock_names.items() if name not in locked and coin_id not in quotes]
+
+        # Another worker may have finished refreshing some of them since they were read
+        refreshed = load_cached_prices(mine)
+        quotes.update(refreshed)
+        mine = [
+            coin_id for coin_id in mine
+            if coin_id not in refreshed or refreshed[coin_id]['age_seconds'] >= PRICE_CACHE_TTL
+        ]
+        if mine:
+            fetched.update(refresh_usd_quotes(mine))
+
+    deadline = time.time() + CACHE_LOCK_WAIT
+    while waiting and time.time() < deadline:
+        time.sleep(0.05)
+        # A lock we can take has been released, so its holder's refresh is
+        # done, even if CoinGecko had no price for the coin
+        waiting_locks = {f"refresh:{PRICE_KEY_PREFIX}{coin_id}": coin_id for coin_id in waiting}
+        with cache_backend.try_locks(waiting_locks) as released:
+            done = [waiting_locks[name] for name in released]
+        quotes.update(load_cached_prices(done))
+        waiting = [coin_id for coin_id in waiting if coin_id not in done]
+    if waiting:
+        # The other worker's refresh is taking too long, fetch them ourselves
+        fetched.update(refresh_usd_quotes(waiting))
+
+    for coin_id, data in fetched.items():
+        quotes[coin_id] = {**data, 'age_seconds': 0}
+    return quotes, list(fetched)
+
+def fetch_coin_data(coin_ids, vs_currency='usd'):
+    """Fetch current price data from CoinGecko API, falling back to last-known-good prices
+
+    USD quotes are shared by every user through price_cache, so only ids
+    without a quote younger than PRICE_CACHE_TTL are requested upstream.
+    Quotes older than that keep their age_seconds.
+    """
+    if isinstance(coin_ids, str):
+        coin_ids = coin_ids.split(',')
+    coin_ids = list(dict.fromkeys(coin_ids))
+
+    if vs_currency != 'usd':
+        prices, _ = fetch_prices_upstream(coin_ids, vs_currency)
+        return prices
+
+    prices, _ = get_usd_quotes(coin_ids)
+    for data in prices.values():
+        if data['age_seconds'] < PRICE_CACHE_TTL:
+            del data['age_seconds']
+    return prices
+
+@rate_limited(0.5)  # Maximum 1 request every 2 seconds
+def fetch_markets_page(page, per_page, order):
+    """Fetch one page of /coins/markets from CoinGecko"""
+    params = {
+        'vs_currency': 'usd',
+        'order': order,
+        'per_page': per_page,
+        'page': page,
+        'sparkline': 'false'
+    }
+    response = coingecko_get('/coins/markets', params=params, timeout=10)
+    return response.json()
+
+def coins_list_cache_key(page, per_page, order='market_cap_desc'):
+    return f"coins_list_{page}_{per_page}_{order}"
+
+def load_coins_list(page=1, per_page=50, order='market_cap_desc'):
+    """Fetch list of coins from CoinGecko with caching
+
+    Returns (data, stale_age, version): stale_age is the age in seconds of
+    expired data served because the API failed, and version identifies the
+    cache entry data was read from or written to (None if it isn't cached).
+    """
+    cache_key = coins_list_cache_key(page, per_page, order)
+    data, age, version = cache_backend.get_entry(cache_key)
+
+    # Return cached data if it's less than 5 minutes old
+    if data is not None and age < COIN_CACHE_TTL:
+        logger.info("Returning cached coin data")
+        return data, None, version
+
+    try:
+        # Don't queue behind the rate limiter when the upstream is known to be down
+        if upstream_breaker.is_open:
+            raise CircuitOpenError("CoinGecko circuit open")
+
+        # Only one worker refreshes a page; the others serve the expired page
+        # meanwhile, or wait for the refresh if they have nothing to serve
+        wait = 0 if data is not None else CACHE_LOCK_WAIT
+        with cache_backend.lock(f"refresh:{cache_key}", wait=wait) as acquired:
+            latest, latest_age, latest_version = cache_backend.get_entry(cache_key)
+            if latest is not None and latest_age < COIN_CACHE_TTL:
+                return latest, None, latest_version
+            if not acquired and data is not None:
+                return data, age, version
+
+            fresh = fetch_markets_page(page, per_page, order)
+            return fresh, None, write_cache(cache_key, fresh)
 
     except requests.RequestException as e:
         logger.error(f"Error fetching coins list: {e}")
         
         # Return cached data if available, even if expired
-        with get_db_connection() as conn:
-            cursor = conn.execute(
-                'SELECT data FROM coin_cache WHERE endpoint = ?', 
-                (cache_key,)
-            )
-            cache_data = cursor.fetchone()
-            if cache_data:
-                logger.info("Returning expired cached data due to API error")
-                return json.loads(cache_data['data'])
+        if data is not None:
+            logger.info("Returning expired cached data due to API error")
+            return data, age, version
         
-        return []
+        return [], None, None
+
+def fetch_coins_list(page=1, per_page=50, order='market_cap_desc', with_age=False):
+    """Fetch list of coins from CoinGecko with caching
+
+    With with_age=True a (data, stale_age) tuple is returned, where stale_age
+    is the age in seconds of expired data served because the API failed.
+    """
+    data, stale_age, _ = load_coins_list(page, per_page, order)
+    return (data, stale_age) if with_age else data
 
 def search_coins(query, limit=10):
     """Search coins by name or symbol"""
+    cache_key = f"search_{query.lower()}"
+    cached, age = read_cache(cache_key)
+    if cached is not None and age < SEARCH_CACHE_TTL:
+        return cached[:limit]
+
     try:
-        url = f"{COINGECKO_API_BASE}/search"
-        params = {'query': query}
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Return limited results
-        return data.get('coins', [])[:limit]
+        # Only one worker searches upstream for the same query
+        wait = 0 if cached is not None else CACHE_LOCK_WAIT
+        with cache_backend.lock(f"refresh:{cache_key}", wait=wait) as acquired:
+            latest, latest_age = read_cache(cache_key)
+            if latest is not None and latest_age < SEARCH_CACHE_TTL:
+                return latest[:limit]
+            if not acquired and cached is not None:
+                return cached[:limit]
+
+            params = {'query': query}
+            
+            response = coingecko_get('/search', params=params, timeout=10)
+            data = response.json()
+            write_cache(cache_key, data.get('coins', []), SEARCH_ENTRY_TTL)
+            
+            # Return limited results
+            return data.get('coins', [])[:limit]
     except requests.RequestException as e:
         logger.error(f"Error searching coins: {e}")
-        return []
+        if cached is not None:
+            return cached[:limit]
+        return search_catalog(query, limit)
+
+def load_coin_catalog():
+    """Return the full id/symbol/name coin list, refreshed once it is older than CATALOG_TTL"""
+    catalog, age = read_cache('coins_catalog')
+    if catalog is None or age >= CATALOG_TTL:
+        try:
+            # Only one worker downloads the catalog, the others keep the one they have
+            wait = 0 if catalog is not None else CACHE_LOCK_WAIT
+            with cache_backend.lock('refresh:coins_catalog', wait=wait) as acquired:
+                latest, latest_age = read_cache('coins_catalog')
+                if latest is not None and latest_age < CATALOG_TTL:
+                    return latest
+                if acquired or catalog is None:
+                    catalog = coingecko_get('/coins/list', timeout=30).json()
+                    write_cache('coins_catalog', catalog)
+        except requests.RequestException as e:
+            logger.error(f"Error fetching coin catalog: {e}")
+    return catalog or []
+
+def search_catalog(query, limit=10):
+    """Search the cached coin catalog, exact symbol matches first"""
+    query = query.lower()
+    catalog, _ = read_cache('coins_catalog')
+    matches = [
+        coin for coin in catalog or []
+        if coin['symbol'].lower() == query or query in coin['name'].lower()
+    ]
+    matches.sort(key=lambda coin: (coin['symbol'].lower() != query, not coin['name'].lower().startswith(query)))
+    return matches[:limit]
+
+def compute_top_growth():
+    """Return the top-growth ranking, recomputing it unless another worker already is"""
+    cached, _ = read_cache('top_growth')
+    wait = 0 if cached is not None else TOP_GROWTH_LOCK_TTL
+    with cache_backend.lock('refresh:top_growth', ttl=TOP_GROWTH_LOCK_TTL, wait=wait) as acquired:
+        latest, latest_age = read_cache('top_growth')
+        if latest is not None and latest_age < TOP_GROWTH_TTL:
+            return latest
+        if not acquired and cached is not None:
+            return cached
+        return rank_top_growth()
+
+def rank_top_growth():
+    """Rank the top 10 coins by market cap on 1-year growth and cache the result"""
+    # Get top 10 coins by market cap
+    params = {
+        'vs_currency': 'usd',
+        'order': 'market_cap_desc',
+        'per_page': 10,  # Only top 10
+        'page': 1,
+        'sparkline': 'false'
+    }
+    response = coingecko_get('/coins/markets', params=params, timeout=15)
+    coins_data = response.json()
+
+    growth_coins = []
+    for coin in coins_data:
+        coin_id = coin['id']
+        # Fetch 1-year historical price data
+        hist_params = {'vs_currency': 'usd', 'days': 365}
+        try:
+            hist_resp = coingecko_get(f'/coins/{coin_id}/market_chart', params=hist_params, timeout=15)
+        except requests.HTTPError:
+            # Skip this coin; connection errors or an open circuit abort the computation
+            continue
+        hist_data = hist_resp.json()
+        prices = hist_data.get('prices', [])
+        if not prices or len(prices) < 2:
+            continue
+        old_price = prices[0][1]
+        current_price = prices[-1][1]
+        if old_price == 0:
+            continue
+        growth = ((current_price - old_price) / old_price) * 100
+        growth_coins.append({
+            'id': coin_id,
+            'name': coin['name'],
+            'symbol': coin['symbol'].upper(),
+            'current_price': current_price,
+            'market_cap': coin.get('market_cap', 0),
+            'market_cap_rank': coin.get('market_cap_rank', 0),
+            'price_change_24h': coin.get('price_change_24h', 0),
+            'price_change_percentage_24h': coin.get('price_change_percentage_24h', 0),
+            'price_change_percentage_1y': growth
+        })
+        time.sleep(1.2)  # To avoid CoinGecko rate limits
+
+    growth_coins.sort(key=lambda x: x['price_change_percentage_1y'], reverse=True)
+    write_cache('top_growth', growth_coins)
+    return growth_coins
 
 def calculate_portfolio_summary(portfolio_items):
     """Calculate portfolio summary statistics"""
@@ -221,22 +1321,273 @@ def calculate_portfolio_summary(portfolio_items):
         'total_holdings': total_holdings
     }
 
+# Portfolio snapshots
+def take_portfolio_snapshot():
+    """Store current portfolio totals for every user, skipping users with unpriced holdings"""
+    with get_db_connection() as conn:
+        cursor = conn.execute('SELECT user_id, coin_id, quantity, purchase_price FROM portfolio')
+        portfolio_items = [dict(row) for row in cursor.fetchall()]
+
+        # Holdings at each user's last snapshot, to value what was bought or sold since
+        cursor = conn.execute('''
+            SELECT user_id, holdings FROM portfolio_snapshots
+            WHERE id IN (SELECT MAX(id) FROM portfolio_snapshots GROUP BY user_id)
+        ''')
+        previous_holdings = {row['user_id']: row['holdings'] for row in cursor.fetchall()}
+
+    items_by_user = {}
+    for item in portfolio_items:
+        items_by_user.setdefault(item['user_id'], []).append(item)
+    previous_holdings = {
+        user_id: app.json.loads(holdings) if holdings is not None else None
+        for user_id, holdings in previous_holdings.items() if user_id in items_by_user
+    }
+
+    # One shared price fetch covers every user's holdings, including coins sold since the last snapshot
+    coin_ids = [item['coin_id'] for item in portfolio_items]
+    for holdings in previous_holdings.values():
+        coin_ids.extend(holdings or ())
+    price_data = fetch_coin_data(coin_ids) if coin_ids else {}
+
+    taken_at = datetime.now().isoformat()
+    snapshots = {}
+    rows = []
+    for user_id, items in items_by_user.items():
+        if any(item['coin_id'] not in price_data for item in items):
+            # A missing price would show up as a fake drawdown in the history
+            logger.warning(f"Skipping portfolio snapshot for {user_id}, prices unavailable")
+            continue
+
+        holdings = {}
+        for item in items:
+            item['current_value'] = price_data[item['coin_id']].get('usd', 0) * float(item['quantity'])
+            holdings[item['coin_id']] = holdings.get(item['coin_id'], 0) + float(item['quantity'])
+        summary = calculate_portfolio_summary(items)
+
+        # Lots added or removed since the last snapshot are deposits or withdrawals
+        # at today's market price, not performance
+        previous = previous_holdings.get(user_id, {})
+        if previous is None:
+            net_flow = None  # Snapshot from before holdings were recorded
+        elif all(coin_id in price_data for coin_id in previous):
+            net_flow = sum(
+                (holdings.get(coin_id, 0) - previous.get(coin_id, 0)) * price_data[coin_id].get('usd', 0)
+                for coin_id in holdings.keys() | previous.keys()
+            )
+        else:
+            net_flow = None  # A sold coin couldn't be priced
+
+        snapshots[user_id] = summary
+        rows.append((
+            user_id, taken_at, summary['total_value'], summary['total_cost'], summary['total_holdings'],
+            net_flow, app.json.dumps(holdings)
+        ))
+
+    with get_db_connection() as conn:
+        conn.executemany('''
+            INSERT INTO portfolio_snapshots
+                (user_id, taken_at, total_value, total_cost, total_holdings, net_flow, holdings)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+    return snapshots
+
+def take_snapshot_if_due():
+    """Take a portfolio snapshot if the last one is SNAPSHOT_INTERVAL old; returns seconds since the last one"""
+    # Every worker runs the scheduler, the one holding the lock checks and snapshots
+    with cache_backend.lock('snapshot', ttl=SNAPSHOT_LOCK_TTL, wait=0) as acquired:
+        if not acquired:
+            return 0
+
+        with get_db_connection() as conn:
+            cursor = conn.execute('SELECT MAX(taken_at) AS taken_at FROM portfolio_snapshots')
+            last = cursor.fetchone()['taken_at']
+
+        # Don't double up on snapshots after a restart, or right after another worker's
+        elapsed = (datetime.now() - datetime.fromisoformat(last)).total_seconds() if last else SNAPSHOT_INTERVAL
+        if elapsed >= SNAPSHOT_INTERVAL:
+            take_portfolio_snapshot()
+            elapsed = 0
+        return elapsed
+
+def run_snapshot_scheduler():
+    """Take a portfolio snapshot every SNAPSHOT_INTERVAL seconds"""
+    while True:
+        try:
+            elapsed = take_snapshot_if_due()
+        except Exception as e:
+            logger.error(f"Error taking portfolio snapshot: {e}")
+            elapsed = 0
+        time.sleep(SNAPSHOT_INTERVAL - min(elapsed, SNAPSHOT_INTERVAL))
+
+def calculate_performance_metrics(values, flows, span_seconds):
+    """Time-weighted return, max drawdown and annualized volatility of a snapshot series.
+
+    flows[i] is the market value of lots added (positive) or removed
+    (negative) between snapshots i - 1 and i, so buying or selling doesn't
+    show up as performance. Periods with an unknown flow (None) are left out.
+    All results are percentages.
+    """
+    # Sub-period returns with the cash flow removed, one per pair of snapshots
+    returns = [
+        (value - flow) / prev_value - 1
+        for prev_value, value, flow in zip(values, values[1:], flows[1:])
+        if prev_value > 0 and flow is not None
+    ]
+    if not returns:
+        return {'time_weighted_return': 0, 'max_drawdown': 0, 'volatility': 0}
+
+    # Growth of 1 unit invested, drawdown is measured against its running peak
+    growth = 1.0
+    peak = 1.0
+    max_drawdown = 0.0
+    for period_return in returns:
+        growth *= 1 + period_return
+        if growth > peak:
+            peak = growth
+        elif 1 - growth / peak > max_drawdown:
+            max_drawdown = 1 - growth / peak
+
+    volatility = 0.0
+    if len(returns) > 1:
+        mean = sum(returns) / len(returns)
+        variance = sum((period_return - mean) ** 2 for period_return in returns) / len(returns)
+        periods_per_year = 365 * 24 * 3600 * len(returns) / span_seconds if span_seconds > 0 else 0
+        volatility = math.sqrt(variance * periods_per_year)
+
+    return {
+        'time_weighted_return': (growth - 1) * 100,
+        'max_drawdown': max_drawdown * 100,
+        'volatility': volatility * 100
+    }
+
+# Startup warm-up
+app_ready = threading.Event()
+app_ready.set()  # Only cleared while a warm-up is running
+
+def warm_market_pages():
+    for page, per_page in WARMUP_MARKET_PAGES:
+        fetch_coins_list(page=page, per_page=per_page)
+
+def warm_prices():
+    """Fetch current prices for every coin anyone holds or watches"""
+    with get_db_connection() as conn:
+        cursor = conn.execute('SELECT coin_id FROM portfolio UNION SELECT coin_id FROM watchlist')
+        coin_ids = [row['coin_id'] for row in cursor.fetchall()]
+    if coin_ids:
+        fetch_coin_data(coin_ids)
+
+def warm_top_growth():
+    _, age = read_cache('top_growth')
+    if age is None or age >= TOP_GROWTH_TTL:
+        compute_top_growth()
+
+def run_warm_up_tasks():
+    """Run the warm-up tasks one after another, so together they stay within
+    CoinGecko's rate limit instead of each task spending its own"""
+    for task in (warm_prices, warm_market_pages, load_coin_catalog, warm_top_growth):
+        # A 429 opens the circuit, stop rather than keep it open
+        if upstream_breaker.is_open:
+            logger.warning(f"CoinGecko circuit open, warm-up stopped before {task.__name__}")
+            return
+        try:
+            task()
+        except Exception as e:
+            logger.error(f"Warm-up task {task.__name__} failed: {e}")
+
+def warm_up_caches():
+    """Preload the caches the first requests after a restart would otherwise miss"""
+    start = time.time()
+    worker = threading.Thread(target=run_warm_up_tasks, daemon=True)
+    worker.start()
+    worker.join(WARMUP_TIMEOUT)
+
+    # Don't hold traffic back on a slow upstream, an unfinished warm-up keeps running
+    app_ready.set()
+    if worker.is_alive():
+        logger.warning(f"Warm-up timed out after {WARMUP_TIMEOUT}s, still running")
+    logger.info(f"Warm-up finished in {time.time() - start:.1f}s")
+
+def start_background_jobs():
+    """Start the cache warm-up, the snapshot scheduler and the alert price refresher"""
+    app_ready.clear()
+    threading.Thread(target=warm_up_caches, daemon=True).start()
+    threading.Thread(target=run_snapshot_scheduler, daemon=True).start()
+    threading.Thread(target=run_alert_refresher, daemon=True).start()
+
+background_jobs_started = False
+startup_lock = threading.Lock()
+
+def create_app():
+    """Prepare this process to serve: create the tables and start the background jobs once.
+
+    WSGI servers load the app through it, e.g. gunicorn 'app:create_app()'
+    (without --preload, the job threads don't survive forking workers).
+    """
+    global background_jobs_started
+    with startup_lock:
+        if not background_jobs_started:
+            init_db()
+            start_background_jobs()
+            background_jobs_started = True
+    return app
+
+# Authentication
+def header_authenticate(req):
+    """Default AUTHENTICATE hook.
+
+    With TRUST_USER_HEADER set, the X-User-Id header set by the auth proxy in
+    front of the app names the user and requests without it are rejected.
+    Otherwise the app is single-user: the header is ignored and every request
+    belongs to the default user.
+    """
+    if TRUST_USER_HEADER:
+        return req.headers.get('X-User-Id')
+    return DEFAULT_USER_ID
+
+# Replace with a callable taking the request and returning a user id, or None to reject it
+app.config.setdefault('AUTHENTICATE', header_authenticate)
+
+@app.before_request
+def load_user():
+    """Resolve which user the request belongs to"""
+    if request.method == 'OPTIONS' or request.path == '/api/health':
+        return None
+
+    user_id = app.config['AUTHENTICATE'](request)
+    if not user_id:
+        return jsonify({'error': 'Authentication required'}), 401
+    g.user_id = user_id
+
 # API Routes
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
+    """Health check endpoint, not ready (503) until the startup warm-up is done"""
+    ready = app_ready.is_set()
+    if not ready:
+        status = 'warming_up'
+    else:
+        status = 'degraded' if upstream_breaker.is_open else 'healthy'
+    return jsonify({
+        'status': status,
+        'ready': ready,
+        'timestamp': datetime.now().isoformat(),
+        'cache_backend': cache_backend.name,
+        'upstream': upstream_breaker.status()
+    }), 200 if ready else 503
 
 # Portfolio endpoints
 @app.route('/api/portfolio', methods=['GET'])
 def get_portfolio():
     """Get user's portfolio with current prices"""
     try:
+        portfolio_name = request.args.get('portfolio', 'main')
         with get_db_connection() as conn:
             cursor = conn.execute('''
-                SELECT * FROM portfolio ORDER BY created_at DESC
-            ''')
+                SELECT * FROM portfolio WHERE user_id = ? AND portfolio_name = ?
+                ORDER BY created_at DESC
+            ''', (g.user_id, portfolio_name))
             portfolio_items = [dict(row) for row in cursor.fetchall()]
         
         if not portfolio_items:
@@ -251,9 +1602,24 @@ def get_portfolio():
         
         # Enrich portfolio items with current market data
         enriched_portfolio = []
+        unpriced_coins = []
         for item in portfolio_items:
             coin_id = item['coin_id']
-            market_data = price_data.get(coin_id, {})
+            market_data = price_data.get(coin_id)
+            
+            if market_data is None:
+                # Nothing live or cached, don't pass the lot off as worth 0
+                unpriced_coins.append(coin_id)
+                enriched_portfolio.append({
+                    **item,
+                    'current_price': None,
+                    'current_value': None,
+                    'change_24h': None,
+                    'market_cap': None,
+                    'profit_loss': None,
+                    'profit_loss_percentage': None
+                })
+                continue
             
             current_price = market_data.get('usd', 0)
             change_24h = market_data.get('usd_24h_change', 0)
@@ -278,16 +1644,27 @@ def get_portfolio():
                 'change_24h': change_24h,
                 'market_cap': market_cap,
                 'profit_loss': profit_loss,
-                'profit_loss_percentage': profit_loss_percentage
+                'profit_loss_percentage': profit_loss_percentage,
+                **degraded_fields(market_data.get('age_seconds'))
             }
             enriched_portfolio.append(enriched_item)
         
-        summary = calculate_portfolio_summary(enriched_portfolio)
+        # Totals only cover priced lots, unpriced ones are counted separately
+        priced_portfolio = [item for item in enriched_portfolio if item['current_value'] is not None]
+        summary = calculate_portfolio_summary(priced_portfolio)
+        summary['total_holdings'] = len(enriched_portfolio)
+        summary['unpriced_holdings'] = len(enriched_portfolio) - len(priced_portfolio)
         
-        return jsonify({
+        response = {
             'portfolio': enriched_portfolio,
-            'summary': summary
-        })
+            'summary': summary,
+            **degraded_fields(price_data_age(price_data))
+        }
+        if unpriced_coins:
+            response['warning'] = (
+                'Market data temporarily unavailable for: ' + ', '.join(dict.fromkeys(unpriced_coins))
+            )
+        return jsonify(response)
         
     except Exception as e:
         logger.error(f"Error getting portfolio: {e}")
@@ -307,9 +1684,11 @@ def add_to_portfolio():
         
         with get_db_connection() as conn:
             conn.execute('''
-                INSERT INTO portfolio (coin_id, coin_name, symbol, quantity, purchase_price, notes)
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT INTO portfolio (user_id, portfolio_name, coin_id, coin_name, symbol, quantity, purchase_price, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
+                g.user_id,
+                data.get('portfolio') or 'main',
                 data['coin_id'],
                 data['coin_name'],
                 data['symbol'].upper(),
@@ -332,7 +1711,10 @@ def delete_portfolio_item(portfolio_id):
     """Delete a portfolio item"""
     try:
         with get_db_connection() as conn:
-            cursor = conn.execute('DELETE FROM portfolio WHERE id = ?', (portfolio_id,))
+            cursor = conn.execute(
+                'DELETE FROM portfolio WHERE id = ? AND user_id = ?',
+                (portfolio_id, g.user_id)
+            )
             if cursor.rowcount == 0:
                 return jsonify({'error': 'Portfolio item not found'}), 404
             conn.commit()
@@ -349,7 +1731,10 @@ def get_watchlist():
     """Get user's watchlist with current prices"""
     try:
         with get_db_connection() as conn:
-            cursor = conn.execute('SELECT * FROM watchlist ORDER BY added_at DESC')
+            cursor = conn.execute(
+                'SELECT * FROM watchlist WHERE user_id = ? ORDER BY added_at DESC',
+                (g.user_id,)
+            )
             watchlist_items = [dict(row) for row in cursor.fetchall()]
         
         if not watchlist_items:
@@ -358,49 +1743,37 @@ def get_watchlist():
         # Get current prices for all coins in watchlist
         coin_ids = [item['coin_id'] for item in watchlist_items]
         
-        try:
-            # Use simple/price endpoint instead of markets for better reliability
-            url = f"{COINGECKO_API_BASE}/simple/price"
-            params = {
-                'ids': ','.join(coin_ids),
-                'vs_currencies': 'usd',
-                'include_24h_vol': 'true',
-                'include_24h_change': 'true',
-                'include_market_cap': 'true'
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            market_data = response.json()
-            
-            # Enrich watchlist items with current market data
-            enriched_watchlist = []
-            for item in watchlist_items:
-                coin_id = item['coin_id']
-                coin_market_data = market_data.get(coin_id, {})
-                
-                enriched_item = {
-                    **item,
-                    'current_price': coin_market_data.get('usd', 0),
-                    'price_change_24h': coin_market_data.get('usd_24h_change', 0),
-                    'market_cap': coin_market_data.get('usd_market_cap', 0)
-                }
-                enriched_watchlist.append(enriched_item)
-            
-            return jsonify({
-                'success': True,
-                'watchlist': enriched_watchlist
-            })
-            
-        except requests.RequestException as e:
-            # If API fails, return watchlist without market data
-            logger.error(f"Error fetching market data: {e}")
+        market_data = fetch_coin_data(coin_ids)
+        
+        if not market_data:
+            # If API fails and nothing is cached, return watchlist without market data
             return jsonify({
                 'success': True,
                 'watchlist': watchlist_items,
                 'warning': 'Market data temporarily unavailable'
             })
         
+        # Enrich watchlist items with current market data
+        enriched_watchlist = []
+        for item in watchlist_items:
+            coin_id = item['coin_id']
+            coin_market_data = market_data.get(coin_id, {})
+            
+            enriched_item = {
+                **item,
+                'current_price': coin_market_data.get('usd', 0),
+                'price_change_24h': coin_market_data.get('usd_24h_change', 0),
+                'market_cap': coin_market_data.get('usd_market_cap', 0),
+                **degraded_fields(coin_market_data.get('age_seconds'))
+            }
+            enriched_watchlist.append(enriched_item)
+        
+        return jsonify({
+            'success': True,
+            'watchlist': enriched_watchlist,
+            **degraded_fields(price_data_age(market_data))
+        })
+        
     except Exception as e:
         logger.error(f"Error getting watchlist: {e}")
         return jsonify({
@@ -423,9 +1796,10 @@ def add_to_watchlist():
         with get_db_connection() as conn:
             try:
                 cursor = conn.execute('''
-                    INSERT INTO watchlist (coin_id, coin_name, symbol)
-                    VALUES (?, ?, ?)
+                    INSERT INTO watchlist (user_id, coin_id, coin_name, symbol)
+                    VALUES (?, ?, ?, ?)
                 ''', (
+                    g.user_id,
                     data['coin_id'],
                     data['coin_name'],
                     data['symbol'].upper()
@@ -461,13 +1835,18 @@ def remove_from_watchlist(watchlist_id):
     """Remove a coin from the watchlist"""
     try:
         with get_db_connection() as conn:
-            cursor = conn.execute('DELETE FROM watchlist WHERE id = ?', (watchlist_id,))
+            cursor = conn.execute(
+                'DELETE FROM watchlist WHERE id = ? AND user_id = ?',
+                (watchlist_id, g.user_id)
+            )
             if cursor.rowcount == 0:
                 return jsonify({
                     'success': False,
                     'error': 'Watchlist item not found'
                 }), 404
+            conn.execute('DELETE FROM alerts WHERE watchlist_id = ?', (watchlist_id,))
             conn.commit()
+        alert_index.invalidate()
         
         return jsonify({
             'success': True,
@@ -480,8 +1859,194 @@ def remove_from_watchlist(watchlist_id):
             'success': False,
             'error': str(e)
         }), 500
+
+# Alert endpoints
+@app.route('/api/watchlist/<int:watchlist_id>/alerts', methods=['POST'])
+def add_alert(watchlist_id):
+    """Attach a price alert rule to a watchlist entry"""
+    try:
+        data = request.get_json()
+        
+        alert_type = data.get('alert_type')
+        if alert_type not in ('above', 'below', 'percent_move'):
+            return jsonify({
+                'success': False,
+                'error': 'alert_type must be one of: above, below, percent_move'
+            }), 400
+        
+        try:
+            threshold = float(data['threshold'])
+            window_minutes = int(data.get('window_minutes', 60)) if alert_type == 'percent_move' else None
+        except (KeyError, TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid threshold or window_minutes'
+            }), 400
+        
+        if threshold <= 0 or (window_minutes is not None and window_minutes <= 0):
+            return jsonify({
+                'success': False,
+                'error': 'threshold and window_minutes must be positive'
+            }), 400
+        
+        with get_db_connection() as conn:
+            cursor = conn.execute(
+                'SELECT coin_id FROM watchlist WHERE id = ? AND user_id = ?',
+                (watchlist_id, g.user_id)
+            )
+            watchlist_item = cursor.fetchone()
+            if not watchlist_item:
+                return jsonify({
+                    'success': False,
+                    'error': 'Watchlist item not found'
+                }), 404
+
+            # Make sure there is a current quote for crossings to be measured from
+            fetch_coin_data([watchlist_item['coin_id']])
+
+            cursor = conn.execute('''
+                INSERT INTO alerts (user_id, watchlist_id, coin_id, alert_type, threshold, window_minutes)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (g.user_id, watchlist_id, watchlist_item['coin_id'], alert_type, threshold, window_minutes))
+            conn.commit()
+            
+            cursor = conn.execute('SELECT * FROM alerts WHERE id = ?', (cursor.lastrowid,))
+            new_alert = dict(cursor.fetchone())
+        alert_index.invalidate()
+        
+        return jsonify({
+            'success': True,
+            'data': new_alert,
+            'message': 'Alert created successfully'
+        }), 201
+        
+    except Exception as e:
+        logger.error(f"Error adding alert: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/alerts', methods=['GET'])
+def get_alerts():
+    """List alert rules, optionally only the active ones"""
+    try:
+        query = 'SELECT * FROM alerts WHERE user_id = ?'
+        if request.args.get('active') == 'true':
+            query += ' AND active = 1'
+        
+        with get_db_connection() as conn:
+            cursor = conn.execute(query + ' ORDER BY created_at DESC', (g.user_id,))
+            alerts = [dict(row) for row in cursor.fetchall()]
+        
+        return jsonify({
+            'success': True,
+            'alerts': alerts
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting alerts: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/alerts/<int:alert_id>', methods=['DELETE'])
+def delete_alert(alert_id):
+    """Delete an alert rule"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.execute(
+                'DELETE FROM alerts WHERE id = ? AND user_id = ?',
+                (alert_id, g.user_id)
+            )
+            if cursor.rowcount == 0:
+                return jsonify({
+                    'success': False,
+                    'error': 'Alert not found'
+                }), 404
+            conn.commit()
+        alert_index.invalidate()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Alert deleted successfully'
+        })
+        
+    except Exception as e:
+        logger.error(f"Error deleting alert: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/alerts/triggered', methods=['GET'])
+def get_triggered_alerts():
+    """Get triggered alerts, newer than since_id when given"""
+    try:
+        since_id = request.args.get('since_id', 0, type=int)
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        
+        with get_db_connection() as conn:
+            cursor = conn.execute('''
+                SELECT * FROM alert_events WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?
+            ''', (g.user_id, since_id, limit))
+            events = [dict(row) for row in cursor.fetchall()]
+        
+        return jsonify({
+            'success': True,
+            'alerts': events,
+            'last_id': events[-1]['id'] if events else since_id
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting triggered alerts: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
     
 
+# Price endpoints
+@app.route('/api/prices/batch', methods=['POST'])
+def get_batch_prices():
+    """Get USD quotes for many coins at once, each with its age"""
+    try:
+        data = request.get_json(silent=True) or {}
+        coin_ids = data.get('ids')
+        if isinstance(coin_ids, str):
+            coin_ids = coin_ids.split(',')
+        if not isinstance(coin_ids, list) or not all(isinstance(coin_id, str) for coin_id in coin_ids):
+            return jsonify({'error': 'ids must be a list of coin ids'}), 400
+        
+        coin_ids = list(dict.fromkeys(coin_id.strip() for coin_id in coin_ids if coin_id.strip()))
+        if len(coin_ids) > MAX_BATCH_IDS:
+            return jsonify({'error': f'At most {MAX_BATCH_IDS} ids per request'}), 400
+        
+        # Same cache lookup, per-coin refresh locks and fallback as every other price read
+        quotes, fetched_ids = get_usd_quotes(coin_ids)
+        
+        prices = {}
+        for coin_id in coin_ids:
+            if coin_id in quotes:
+                quote = quotes[coin_id]
+                prices[coin_id] = {
+                    **quote,
+                    'age_seconds': round(quote['age_seconds']),
+                    'stale': quote['age_seconds'] >= PRICE_CACHE_TTL
+                }
+        
+        return jsonify({
+            'prices': prices,
+            'missing': [coin_id for coin_id in coin_ids if coin_id not in prices],
+            'fetched': len(fetched_ids),
+            'cached': len(prices) - len(fetched_ids)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting batch prices: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # Market data endpoints
 @app.route('/api/coins/all', methods=['GET'])
 def get_all_coins():
@@ -490,7 +2055,16 @@ def get_all_coins():
         page = int(request.args.get('page', 1))
         per_page = min(int(request.args.get('per_page', 50)), 100)  # Limit to 100
         
-        coins_data = fetch_coins_list(page=page, per_page=per_page)
+        # Unchanged market pages are answered with the body serialized last time
+        cache_key = coins_list_cache_key(page, per_page)
+        response_key = ('coins_all', page, per_page)
+        version, age = cache_backend.stat(cache_key)
+        if version is not None and age < COIN_CACHE_TTL:
+            body = response_cache.get(response_key, version)
+            if body is not None:
+                return json_bytes_response(body)
+        
+        coins_data, stale_age, version = load_coins_list(page=page, per_page=per_page)
         
         # Set fixed total count to prevent glitching
         total_coins = 500
@@ -521,12 +2095,22 @@ def get_all_coins():
             except KeyError:
                 continue
         
-        return jsonify({
+        payload = {
             'coins': formatted_coins,
             'total': total_coins,
             'page': page,
-            'per_page': per_page
-        })
+            'per_page': per_page,
+            **degraded_fields(stale_age)
+        }
+        
+        if stale_age is None and version is not None:
+            # Tagged with the version coins_data came from, a newer page written
+            # by another worker meanwhile doesn't get this body
+            body = dumps_bytes(payload)
+            response_cache.put(response_key, version, body)
+            return json_bytes_response(body)
+        
+        return jsonify(payload)
         
     except Exception as e:
         logger.error(f"Error in get_all_coins: {str(e)}")
@@ -544,54 +2128,15 @@ def get_all_coins():
 @app.route('/api/coins/top-growth', methods=['GET'])
 def get_top_growth_coins():
     """Get top 10 coins with best growth in the last year"""
+    limit = request.args.get('limit', 10, type=int)
+    cached, age = read_cache('top_growth')
     try:
-        limit = int(request.args.get('limit', 10))
-        # Get top 10 coins by market cap
-        url = f"{COINGECKO_API_BASE}/coins/markets"
-        params = {
-            'vs_currency': 'usd',
-            'order': 'market_cap_desc',
-            'per_page': 10,  # Only top 10
-            'page': 1,
-            'sparkline': 'false'
-        }
-        response = requests.get(url, params=params, timeout=15)
-        response.raise_for_status()
-        coins_data = response.json()
-
-        growth_coins = []
-        for coin in coins_data:
-            coin_id = coin['id']
-            # Fetch 1-year historical price data
-            hist_url = f"{COINGECKO_API_BASE}/coins/{coin_id}/market_chart"
-            hist_params = {'vs_currency': 'usd', 'days': 365}
-            hist_resp = requests.get(hist_url, params=hist_params, timeout=15)
-            if hist_resp.status_code != 200:
-                continue
-            hist_data = hist_resp.json()
-            prices = hist_data.get('prices', [])
-            if not prices or len(prices) < 2:
-                continue
-            old_price = prices[0][1]
-            current_price = prices[-1][1]
-            if old_price == 0:
-                continue
-            growth = ((current_price - old_price) / old_price) * 100
-            growth_coins.append({
-                'id': coin_id,
-                'name': coin['name'],
-                'symbol': coin['symbol'].upper(),
-                'current_price': current_price,
-                'market_cap': coin.get('market_cap', 0),
-                'market_cap_rank': coin.get('market_cap_rank', 0),
-                'price_change_24h': coin.get('price_change_24h', 0),
-                'price_change_percentage_24h': coin.get('price_change_percentage_24h', 0),
-                'price_change_percentage_1y': growth
-            })
-            time.sleep(1.2)  # To avoid CoinGecko rate limits
+        if cached is not None and age < TOP_GROWTH_TTL:
+            growth_coins = cached
+        else:
+            growth_coins = compute_top_growth()
 
-        # Sort and return top growth coins
-        growth_coins.sort(key=lambda x: x['price_change_percentage_1y'], reverse=True)
+        # Return top growth coins
         top_growth_coins = growth_coins[:limit]
         return jsonify({
             'coins': top_growth_coins,
@@ -600,6 +2145,17 @@ def get_top_growth_coins():
         })
     except Exception as e:
         logger.error(f"Error fetching top growth coins: {e}")
+
+        # Serve the last successful computation rather than nothing
+        if cached:
+            top_growth_coins = cached[:limit]
+            return jsonify({
+                'coins': top_growth_coins,
+                'total': len(top_growth_coins),
+                'period': '1y',
+                **degraded_fields(age)
+            })
+
         return jsonify({
             'coins': [],
             'total': 0,
@@ -616,7 +2172,7 @@ def get_market_growth():
         period = request.args.get('period', '1y')
         
         # Fetch top 100 coins for growth analysis
-        coins_data = fetch_coins_list(page=1, per_page=100)
+        coins_data, stale_age, _ = load_coins_list(page=1, per_page=100)
         
         if not coins_data:
             return jsonify({'error': 'Unable to fetch market data'}), 500
@@ -662,13 +2218,49 @@ def get_market_growth():
             'best_performer': best_performer,
             'average_growth': average_growth,
             'top_performers': top_performers,
-            'total_market_cap': total_market_cap
+            'total_market_cap': total_market_cap,
+            **degraded_fields(stale_age)
         })
         
     except Exception as e:
         logger.error(f"Error getting market growth: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/analytics/portfolio-history', methods=['GET'])
+def get_portfolio_history():
+    """Get portfolio value history and performance over a period"""
+    try:
+        days = min(request.args.get('days', 30, type=int), 3650)
+        since = (datetime.now() - timedelta(days=days)).isoformat()
+        
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None  # Plain tuples, this can be thousands of rows
+            cursor.execute('''
+                SELECT taken_at, total_value, net_flow FROM portfolio_snapshots
+                WHERE user_id = ? AND taken_at >= ? ORDER BY taken_at
+            ''', (g.user_id, since))
+            rows = cursor.fetchall()
+        
+        taken_at, values, flows = (list(column) for column in zip(*rows)) if rows else ([], [], [])
+        span_seconds = (
+            datetime.fromisoformat(taken_at[-1]) - datetime.fromisoformat(taken_at[0])
+        ).total_seconds() if rows else 0
+        
+        return jsonify({
+            'days': days,
+            'snapshots': len(rows),
+            'series': [
+                {'timestamp': timestamp, 'value': value}
+                for timestamp, value in zip(taken_at, values)
+            ],
+            **calculate_performance_metrics(values, flows, span_seconds)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting portfolio history: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # Export endpoints
 @app.route('/api/export/portfolio', methods=['GET'])
 def export_portfolio():
@@ -676,11 +2268,14 @@ def export_portfolio():
     try:
         format_type = request.args.get('format', 'json').lower()
         
+        portfolio_name = request.args.get('portfolio', 'main')
+        
         # Get portfolio data
         with get_db_connection() as conn:
             cursor = conn.execute('''
-                SELECT * FROM portfolio ORDER BY created_at DESC
-            ''')
+                SELECT * FROM portfolio WHERE user_id = ? AND portfolio_name = ?
+                ORDER BY created_at DESC
+            ''', (g.user_id, portfolio_name))
             portfolio_items = [dict(row) for row in cursor.fetchall()]
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -723,5 +2318,8 @@ def internal_error(error):
 
 # Initialize database and run app
 if __name__ == '__main__':
-    init_db()
-    app.run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
+    debug = True
+    # With the reloader on, the first process only watches for changes, start up in the serving one
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
+    app.run(debug=debug, host='127.0.0.1', port=5000)
\ No newline at end of file
@@ -0,0 +1,84 @@
+import timeit
+
+from flask.json.provider import DefaultJSONProvider
+
+from app import app, OrjsonProvider, orjson
+
+ROUNDS = 200
+
+def market_page(per_page=100):
+    """A /api/coins/all page shaped like the real response"""
+    return {
+        'coins': [
+            {
+                'id': f'coin-{i}',
+                'name': f'Coin {i}',
+                'symbol': f'C{i}',
+                'current_price': 12345.6789 / (i + 1),
+                'market_cap': 987654321012 // (i + 1),
+                'market_cap_rank': i + 1,
+                'price_change_24h': -12.345 + i,
+                'price_change_percentage_24h': 1.2345 - i / 100
+            }
+            for i in range(per_page)
+        ],
+        'total': 500,
+        'page': 1,
+        'per_page': per_page
+    }
+
+def portfolio(lots=5000):
+    """A /api/portfolio response for a large portfolio"""
+    return {
+        'portfolio': [
+            {
+                'id': i,
+                'user_id': 'default',
+                'portfolio_name': 'main',
+                'coin_id': f'coin-{i % 300}',
+                'coin_name': f'Coin {i % 300}',
+                'symbol': f'C{i % 300}',
+                'quantity': 0.5 + i,
+                'purchase_price': 100.25 + i,
+                'notes': 'DCA buy',
+                'created_at': '2026-01-01 12:00:00',
+                'updated_at': '2026-01-01 12:00:00',
+                'current_price': 110.5 + i,
+                'current_value': (110.5 + i) * (0.5 + i),
+                'change_24h': 2.5,
+                'market_cap': 123456789,
+                'profit_loss': 10.25 * (0.5 + i),
+                'profit_loss_percentage': 10.2
+            }
+            for i in range(lots)
+        ],
+        'summary': {'total_value': 1.0, 'total_cost': 1.0, 'total_holdings': lots}
+    }
+
+def bench(label, func):
+    seconds = timeit.timeit(func, number=ROUNDS) / ROUNDS
+    print(f"  {label:<40} {seconds * 1000:8.3f} ms")
+
+def run():
+    default_provider = DefaultJSONProvider(app)
+    payloads = {
+        'market page (100 coins)': market_page(),
+        'portfolio (5000 lots)': portfolio()
+    }
+
+    for name, payload in payloads.items():
+        print(f"{name}:")
+        bench("json (Flask default provider)", lambda: default_provider.dumps(payload))
+        if orjson:
+            fast_provider = OrjsonProvider(app)
+            bench("orjson provider", lambda: fast_provider.dumps_bytes(payload))
+
+    # Cached market page: old path decodes coin_cache and re-encodes it, new path reuses stored bytes
+    stored = default_provider.dumps(market_page())
+    print("cached market page response:")
+    bench("json.loads + json dumps", lambda: default_provider.dumps(default_provider.loads(stored)))
+    body = stored.encode()
+    bench("pre-serialized bytes", lambda: bytes(body))
+
+if __name__ == "__main__":
+    run()
@@ -160,7 +160,7 @@ const PortfolioRow = React.memo(({ item, onRemove }) => (
       {formatCurrency(item.current_price)}
     </td>
     <td className="px-6 py-4 text-sm text-gray-900">
-      {formatCurrency(item.quantity * item.current_price)}
+      {formatCurrency(item.current_price == null ? null : item.quantity * item.current_price)}
     </td>
     <td className="px-6 py-4 text-sm">
       <span className={`flex items-center ${
@@ -0,0 +1,74 @@
+import sqlite3
+
+import pytest
+
+import app as tracker
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """An empty database with one watched coin, and a cache shared by the simulated workers"""
+    path = str(tmp_path / 'tracker.db')
+    monkeypatch.setattr(tracker, 'DATABASE_PATH', path)
+    monkeypatch.setattr(tracker, 'cache_backend', tracker.MemoryCacheBackend())
+    tracker.init_db()
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO watchlist (id, coin_id, coin_name, symbol) VALUES (1, 'bitcoin', 'Bitcoin', 'BTC')")
+    return path
+
+def add_alert(database, alert_type, threshold, window_minutes=None):
+    with sqlite3.connect(database) as conn:
+        conn.execute('''
+            INSERT INTO alerts (watchlist_id, coin_id, alert_type, threshold, window_minutes)
+            VALUES (1, 'bitcoin', ?, ?, ?)
+        ''', (alert_type, threshold, window_minutes))
+
+def refresh(monkeypatch, index, price):
+    """Store a bitcoin quote the way the worker owning index would"""
+    monkeypatch.setattr(tracker, 'alert_index', index)
+    tracker.store_prices({'bitcoin': {'usd': price}})
+
+def alert_events(database):
+    with sqlite3.connect(database) as conn:
+        return conn.execute('SELECT alert_id, price FROM alert_events ORDER BY id').fetchall()
+
+def test_alerts_fire_on_crossings_only(database, monkeypatch):
+    index = tracker.AlertIndex()
+    refresh(monkeypatch, index, 170)
+    add_alert(database, 'above', 150)
+    add_alert(database, 'below', 160)
+    index.invalidate()
+
+    refresh(monkeypatch, index, 180)  # Already above 150 when the rule was created
+    assert alert_events(database) == []
+    refresh(monkeypatch, index, 155)
+    assert alert_events(database) == [(2, 155)]
+    refresh(monkeypatch, index, 140)
+    refresh(monkeypatch, index, 151)
+    assert alert_events(database) == [(2, 155), (1, 151)]
+
+def test_rule_added_on_another_worker_is_evaluated(database, monkeypatch):
+    worker_a, worker_b = tracker.AlertIndex(), tracker.AlertIndex()
+    refresh(monkeypatch, worker_b, 100)  # Worker B has loaded its index
+
+    add_alert(database, 'above', 150)
+    worker_a.invalidate()
+    refresh(monkeypatch, worker_b, 200)
+    assert alert_events(database) == [(1, 200)]
+
+def test_alert_fires_once_across_workers(database, monkeypatch):
+    add_alert(database, 'above', 150)
+    worker_a, worker_b = tracker.AlertIndex(), tracker.AlertIndex()
+    refresh(monkeypatch, worker_a, 100)
+    refresh(monkeypatch, worker_b, 100)
+
+    refresh(monkeypatch, worker_a, 200)
+    refresh(monkeypatch, worker_b, 100)
+    refresh(monkeypatch, worker_b, 200)
+    assert alert_events(database) == [(1, 200)]
+
+def test_percent_move_sees_every_workers_refreshes(database, monkeypatch):
+    add_alert(database, 'percent_move', 10, window_minutes=60)
+    worker_a, worker_b = tracker.AlertIndex(), tracker.AlertIndex()
+    refresh(monkeypatch, worker_a, 200)
+    refresh(monkeypatch, worker_b, 230)
+    assert alert_events(database) == [(1, 230)]
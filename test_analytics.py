@@ -0,0 +1,108 @@
+import math
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import app as tracker
+from app import calculate_performance_metrics
+
+DAY = 24 * 3600
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Point the app at an empty database"""
+    path = str(tmp_path / 'tracker.db')
+    monkeypatch.setattr(tracker, 'DATABASE_PATH', path)
+    tracker.init_db()
+    return path
+
+def test_no_returns_without_two_snapshots():
+    """A single snapshot has no period to measure"""
+    expected = {'time_weighted_return': 0, 'max_drawdown': 0, 'volatility': 0}
+    assert calculate_performance_metrics([], [], 0) == expected
+    assert calculate_performance_metrics([60000], [60000], 0) == expected
+
+def test_added_lot_is_not_performance():
+    """A lot bought at 10k and worth 60k, added in a flat market"""
+    metrics = calculate_performance_metrics([60000, 60000, 120000], [60000, 0, 60000], 2 * 3600)
+    assert metrics == {'time_weighted_return': 0, 'max_drawdown': 0, 'volatility': 0}
+
+def test_removed_lot_is_not_a_loss():
+    metrics = calculate_performance_metrics([100, 110, 55], [100, 0, -55], 2 * DAY)
+    assert metrics['time_weighted_return'] == pytest.approx(10)
+    assert metrics['max_drawdown'] == 0
+
+def test_returns_are_chained():
+    """10% then 10% again, with a deposit in between that mustn't count"""
+    metrics = calculate_performance_metrics([100, 110, 1121], [100, 0, 1000], 2 * DAY)
+    assert metrics['time_weighted_return'] == pytest.approx(21)
+
+def test_max_drawdown_is_measured_from_the_peak():
+    metrics = calculate_performance_metrics([100, 120, 90, 108, 130], [100, 0, 0, 0, 0], 4 * DAY)
+    assert metrics['max_drawdown'] == pytest.approx(25)
+    assert metrics['time_weighted_return'] == pytest.approx(30)
+
+def test_volatility_is_annualized():
+    """Daily returns of +10% and -10%: stdev 10% per day"""
+    metrics = calculate_performance_metrics([100, 110, 99], [100, 0, 0], 2 * DAY)
+    assert metrics['volatility'] == pytest.approx(10 * math.sqrt(365))
+
+def test_periods_with_unknown_flows_are_skipped():
+    """Snapshots taken before flows were recorded have no net_flow"""
+    metrics = calculate_performance_metrics([100, 300, 330], [None, None, 0], 2 * DAY)
+    assert metrics['time_weighted_return'] == pytest.approx(10)
+
+def test_snapshot_records_added_lots_as_flows(database, monkeypatch):
+    prices = {'bitcoin': {'usd': 60000}, 'ethereum': {'usd': 3000}}
+    monkeypatch.setattr(tracker, 'fetch_coin_data', lambda coin_ids: {coin_id: prices[coin_id] for coin_id in coin_ids})
+
+    def add_lot(coin_id, quantity, purchase_price):
+        with sqlite3.connect(database) as conn:
+            conn.execute('''
+                INSERT INTO portfolio (user_id, coin_id, coin_name, symbol, quantity, purchase_price)
+                VALUES ('alice', ?, ?, ?, ?, ?)
+            ''', (coin_id, coin_id, coin_id, quantity, purchase_price))
+
+    add_lot('bitcoin', 1, 10000)
+    tracker.take_portfolio_snapshot()
+    add_lot('bitcoin', 1, 10000)
+    add_lot('ethereum', 2, None)  # No purchase price, still a deposit
+    tracker.take_portfolio_snapshot()
+    with sqlite3.connect(database) as conn:
+        conn.execute("DELETE FROM portfolio WHERE coin_id = 'ethereum'")
+    prices['bitcoin'] = {'usd': 66000}
+    tracker.take_portfolio_snapshot()
+
+    with sqlite3.connect(database) as conn:
+        rows = conn.execute('SELECT total_value, net_flow FROM portfolio_snapshots ORDER BY id').fetchall()
+    assert rows == [(60000, 60000), (126000, 66000), (132000, -6000)]
+
+    values, flows = zip(*rows)
+    metrics = calculate_performance_metrics(list(values), list(flows), 2 * 3600)
+    # Only the two bitcoin held through the last period gained, 12000 on 126000
+    assert metrics['time_weighted_return'] == pytest.approx(12000 / 126000 * 100)
+
+def test_workers_waking_together_take_one_snapshot(database, monkeypatch):
+    def fetch_coin_data(coin_ids):
+        time.sleep(0.2)
+        return {coin_id: {'usd': 100} for coin_id in coin_ids}
+
+    monkeypatch.setattr(tracker, 'fetch_coin_data', fetch_coin_data)
+    with sqlite3.connect(database) as conn:
+        conn.execute('''
+            INSERT INTO portfolio (user_id, coin_id, coin_name, symbol, quantity)
+            VALUES ('alice', 'bitcoin', 'Bitcoin', 'BTC', 1)
+        ''')
+
+    workers = [threading.Thread(target=tracker.take_snapshot_if_due) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    tracker.take_snapshot_if_due()  # Not due again yet
+
+    with sqlite3.connect(database) as conn:
+        rows = conn.execute('SELECT total_value, net_flow FROM portfolio_snapshots').fetchall()
+    assert rows == [(100, 100)]
@@ -1,5 +1,6 @@
 import requests
 import json
+import time
 
 BASE_URL = "http://localhost:5000/api"
 
@@ -94,6 +95,37 @@ def test_portfolio():
     
     print("-" * 50)
 
+def test_multi_tenant_load(tenants=50, requests_per_tenant=5):
+    """Compare portfolio latency for one tenant against many tenants holding the same coin.
+    The server must run with TRUST_USER_HEADER=1 for X-User-Id to select the tenant"""
+    print(f"Testing multi-tenant load ({tenants} tenants)...")
+    lot = {"coin_id": "bitcoin", "coin_name": "Bitcoin", "symbol": "BTC", "quantity": 0.1}
+    
+    for tenant_count in (1, tenants):
+        users = [f"load-test-{i}" for i in range(tenant_count)]
+        for user in users:
+            requests.post(f"{BASE_URL}/portfolio", json=lot, headers={"X-User-Id": user})
+        
+        # Warm the shared price cache so only per-tenant work is timed
+        requests.get(f"{BASE_URL}/portfolio", headers={"X-User-Id": users[0]})
+        
+        start = time.time()
+        for _ in range(requests_per_tenant):
+            for user in users:
+                requests.get(f"{BASE_URL}/portfolio", headers={"X-User-Id": user})
+        elapsed = time.time() - start
+        
+        total_requests = requests_per_tenant * tenant_count
+        print(f"  {tenant_count} tenant(s): {elapsed / total_requests * 1000:.1f} ms per request")
+        
+        # Clean up the test lots
+        for user in users:
+            response = requests.get(f"{BASE_URL}/portfolio", headers={"X-User-Id": user})
+            for item in response.json()['portfolio']:
+                requests.delete(f"{BASE_URL}/portfolio/{item['id']}", headers={"X-User-Id": user})
+    
+    print("-" * 50)
+
 if __name__ == "__main__":
     print("Crypto Portfolio Tracker API Test")
     print("=" * 50)
@@ -104,6 +136,7 @@ if __name__ == "__main__":
         test_price()
         test_history()
         test_portfolio()
+        test_multi_tenant_load()
         
         print("All tests completed!")
         
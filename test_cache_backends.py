@@ -0,0 +1,176 @@
+import threading
+import time
+
+import pytest
+
+import app as tracker
+
+@pytest.fixture(params=['sqlite', 'memory', 'redis'])
+def backend(request, tmp_path, monkeypatch):
+    """Each cache backend, installed as the app's cache"""
+    monkeypatch.setattr(tracker, 'DATABASE_PATH', str(tmp_path / 'tracker.db'))
+    tracker.init_db()
+    if request.param == 'redis':
+        fakeredis = pytest.importorskip('fakeredis')
+        pytest.importorskip('redis')
+        cache = tracker.RedisCacheBackend('redis://localhost:6379/0')
+        cache.client = fakeredis.FakeRedis()
+    else:
+        cache = tracker.create_cache_backend(request.param)
+    monkeypatch.setattr(tracker, 'cache_backend', cache)
+    return cache
+
+def test_entries_round_trip_with_their_version(backend):
+    key = tracker.PRICE_KEY_PREFIX + 'bitcoin'
+    version = backend.set_many({key: {'usd': 1.5}, 'coins_list_1_50': [{'id': 'bitcoin'}]})
+
+    data, age, entry_version = backend.get_entry(key)
+    assert data == {'usd': 1.5}
+    assert 0 <= age < 5
+    assert entry_version == version == backend.stat(key)[0]
+    assert backend.get('coins_list_1_50')[0] == [{'id': 'bitcoin'}]
+    assert backend.get('missing') == (None, None)
+    assert backend.stat('missing') == (None, None)
+
+def test_entries_expire(backend):
+    backend.set('search_btc', ['bitcoin'], ttl=0.1)
+    assert backend.get('search_btc')[0] == ['bitcoin']
+    time.sleep(0.2)
+    assert backend.get('search_btc') == (None, None)
+    assert backend.stat('search_btc') == (None, None)
+
+def test_lock_is_exclusive_until_released(backend):
+    with backend.lock('refresh:page') as acquired:
+        assert acquired
+        with backend.lock('refresh:page', wait=0) as other:
+            assert not other
+    with backend.lock('refresh:page', wait=0) as acquired:
+        assert acquired
+
+def test_expired_lock_can_be_taken(backend):
+    assert backend.acquire_lock('refresh:page', 'crashed-worker', ttl=0.1)
+    time.sleep(0.2)
+    with backend.lock('refresh:page', wait=0) as acquired:
+        assert acquired
+    # The crashed worker releasing late doesn't free someone else's lock
+    assert backend.acquire_lock('refresh:page', 'worker', ttl=30)
+    backend.release_lock('refresh:page', 'crashed-worker')
+    assert not backend.acquire_lock('refresh:page', 'another-worker', ttl=30)
+
+def test_try_locks_takes_the_free_ones(backend):
+    with backend.lock('refresh:b'):
+        with backend.try_locks(['refresh:a', 'refresh:b', 'refresh:c']) as acquired:
+            assert acquired == {'refresh:a', 'refresh:c'}
+    with backend.try_locks(['refresh:a', 'refresh:b', 'refresh:c']) as acquired:
+        assert len(acquired) == 3
+
+def test_memory_backend_evicts_least_recently_used():
+    cache = tracker.MemoryCacheBackend(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') == (None, None)
+    assert cache.get('a')[0] == 1
+    assert cache.get('c')[0] == 3
+
+def run_concurrently(func, workers=6):
+    threads = [threading.Thread(target=func) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def test_one_worker_refreshes_a_market_page(backend, monkeypatch):
+    calls = []
+
+    def fetch_markets_page(page, per_page, order):
+        calls.append(page)
+        time.sleep(0.2)
+        return [{'id': 'bitcoin', 'name': 'Bitcoin', 'symbol': 'btc'}]
+
+    monkeypatch.setattr(tracker, 'fetch_markets_page', fetch_markets_page)
+    run_concurrently(lambda: tracker.fetch_coins_list(page=1, per_page=50))
+    assert calls == [1]
+
+def test_one_worker_refreshes_a_price(backend, monkeypatch):
+    calls = []
+
+    def fetch_price_chunk(coin_ids, vs_currency):
+        calls.append(coin_ids)
+        time.sleep(0.2)
+        return {coin_id: {'usd': 1.0} for coin_id in coin_ids}
+
+    monkeypatch.setattr(tracker, 'fetch_price_chunk', fetch_price_chunk)
+    run_concurrently(lambda: tracker.fetch_coin_data(['bitcoin', 'ethereum']))
+    assert calls == [['bitcoin', 'ethereum']]
+
+def test_price_refresh_doesnt_wait_for_other_coins(backend, monkeypatch):
+    def fetch_price_chunk(coin_ids, vs_currency):
+        time.sleep(1 if 'slow-coin' in coin_ids else 0)
+        return {coin_id: {'usd': 1.0} for coin_id in coin_ids}
+
+    monkeypatch.setattr(tracker, 'fetch_price_chunk', fetch_price_chunk)
+    slow = threading.Thread(target=tracker.fetch_coin_data, args=(['slow-coin'],))
+    slow.start()
+    time.sleep(0.1)
+    start = time.time()
+    assert tracker.fetch_coin_data(['bitcoin'])['bitcoin']['usd'] == 1.0
+    assert time.time() - start < 0.5
+    slow.join()
+
+def test_stale_page_is_served_while_another_worker_refreshes(backend, monkeypatch):
+    key = tracker.coins_list_cache_key(1, 50)
+    backend.set(key, [{'id': 'bitcoin'}])
+    monkeypatch.setattr(tracker, 'COIN_CACHE_TTL', 0)
+    with backend.lock(f"refresh:{key}"):
+        start = time.time()
+        data, stale_age = tracker.fetch_coins_list(page=1, per_page=50, with_age=True)
+    assert data == [{'id': 'bitcoin'}]
+    assert stale_age is not None
+    assert time.time() - start < 0.5
+
+def test_one_worker_computes_top_growth(backend, monkeypatch):
+    calls = []
+
+    def rank_top_growth():
+        calls.append(1)
+        time.sleep(0.2)
+        tracker.write_cache('top_growth', [{'id': 'bitcoin'}])
+        return [{'id': 'bitcoin'}]
+
+    monkeypatch.setattr(tracker, 'rank_top_growth', rank_top_growth)
+    run_concurrently(tracker.compute_top_growth)
+    assert calls == [1]
+
+def test_waiting_for_a_coin_upstream_has_no_price_for_ends_with_the_refresh(backend, monkeypatch):
+    def fetch_price_chunk(coin_ids, vs_currency):
+        time.sleep(0.2)
+        return {coin_id: {'usd': 1.0} for coin_id in coin_ids if coin_id != 'not-a-coin'}
+
+    monkeypatch.setattr(tracker, 'fetch_price_chunk', fetch_price_chunk)
+    results = []
+
+    def get_quotes():
+        start = time.time()
+        quotes, _ = tracker.get_usd_quotes(['bitcoin', 'not-a-coin'])
+        results.append((time.time() - start, sorted(quotes)))
+
+    run_concurrently(get_quotes, workers=2)
+    assert [coin_ids for _, coin_ids in results] == [['bitcoin'], ['bitcoin']]
+    assert max(elapsed for elapsed, _ in results) < 1
+
+def test_ids_without_a_price_are_not_asked_for_again(backend, monkeypatch):
+    calls = []
+
+    def fetch_price_chunk(coin_ids, vs_currency):
+        calls.append(coin_ids)
+        return {coin_id: {'usd': 1.0} for coin_id in coin_ids if coin_id != 'not-a-coin'}
+
+    monkeypatch.setattr(tracker, 'fetch_price_chunk', fetch_price_chunk)
+    monkeypatch.setattr(tracker, 'PRICE_CACHE_TTL', 0)
+    client = tracker.app.test_client()
+    for _ in range(2):
+        response = client.post('/api/prices/batch', json={'ids': ['bitcoin', 'not-a-coin']})
+        assert response.json['missing'] == ['not-a-coin']
+    assert calls == [['bitcoin', 'not-a-coin'], ['bitcoin']]